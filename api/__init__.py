@@ -1,3 +1,10 @@
 from .ytmusic import YTMusicApi
-from .mapper import find_songs_async, find_song, find_songs_sync
+from .mapper import (
+    find_songs_async,
+    find_song,
+    find_songs_sync,
+    find_songs_stream,
+    find_songs_parallel,
+)
 from .deezer import DeezerApi
+from .cached import CachedMusicApi
@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from classes import Song, MusicApi
+from utils import logger, possibility, similarity, slugify_cached
+from utils.metrics import METRICS
+from utils.ratelimit import RateLimitExceeded
+from .mapper import select_best
+
+AlbumKey = tuple[str, str]
+
+
+def album_key(song: Song) -> AlbumKey | None:
+    """Returns (album, primary artist) in normalized form, None if either is missing"""
+    if song.album is None or len(song.authors) == 0:
+        return None
+    album = song.normalized.album
+    artist = slugify_cached(song.authors[0])
+    if album == "" or artist == "":
+        return None
+    return (album, artist)
+
+
+def group_by_album(songs: list[Song], min_size: int = 2) -> dict[AlbumKey, list[Song]]:
+    """Returns songs grouped by album, only groups of at least min_size songs"""
+    groups: dict[AlbumKey, list[Song]] = {}
+    for song in songs:
+        key = album_key(song)
+        if key is not None:
+            groups.setdefault(key, []).append(song)
+    return {key: group for (key, group) in groups.items() if len(group) >= min_size}
+
+
+def find_songs_by_album(
+    songs: list[Song],
+    api: MusicApi,
+    min_size: int = 2,
+    workers: int = 8,
+    on_result: Callable[[similarity.MatchResult], None] | None = None,
+) -> list[Song]:
+    """
+    Matches songs sharing an album against that album's tracklist,
+    fetched once per album, and returns songs still to be searched one by one:
+    those without a group, whose album was not found or without an identical match
+    """
+    groups = group_by_album(songs, min_size)
+    grouped = {s.id for group in groups.values() for s in group}
+    leftovers = [s for s in songs if s.id not in grouped]
+    indexes = {s.id: index + 1 for (index, s) in enumerate(songs)}
+
+    def match_group(
+        group: list[Song],
+    ) -> tuple[list[similarity.MatchResult], list[Song]]:
+        first = group[0]
+        try:
+            tracks = api.search_album_songs(first.album or "", first.authors[0])
+        except RateLimitExceeded:
+            # the songs are searched one by one instead, which retries throttling
+            return [], group
+        except Exception as exc:
+            logger.log_error(f"Failed fetching album {first.album}: {exc}")
+            return [], group
+        METRICS.inc("album_lookups_total", result="hit" if len(tracks) > 0 else "miss")
+
+        formatted_tracks = [possibility.format_song(t) for t in tracks]
+        results: list[similarity.MatchResult] = []
+        unmatched: list[Song] = []
+        for song in group:
+            matcher = similarity.SongMatcher(possibility.format_song(song))
+            matcher.add(formatted_tracks)
+            found = matcher.result
+            if len(found.identical) == 0:
+                unmatched.append(song)
+                continue
+            _, chosen = select_best(found, indexes[song.id])
+            results.append(similarity.MatchResult(song, found, chosen))
+        return results, unmatched
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # results are handed over here, so on_result is never called concurrently
+        for results, unmatched in executor.map(match_group, groups.values()):
+            for result in results:
+                METRICS.inc("songs_matched_total", tier=result.tier)
+                if on_result is not None:
+                    on_result(result)
+            leftovers.extend(unmatched)
+
+    logger.log_message(
+        f"Albums: {len(groups)} groups of {len(grouped)} songs, "
+        + f"{len(songs) - len(leftovers)} matched, {len(leftovers)} left to search"
+    )
+    return leftovers
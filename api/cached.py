@@ -0,0 +1,128 @@
+from classes import Song, MusicApi
+from classes.playlist import Playlist
+from utils import ratelimit
+from utils.cache import SearchCache
+
+
+def normalize_query(value: str | None) -> str:
+    """Lowercases and collapses whitespace so equivalent queries share a key"""
+    if value is None:
+        return ""
+    return " ".join(value.casefold().split())
+
+
+def search_query(song: Song) -> str:
+    """Returns the part of a search key that identifies the query itself"""
+    artist = song.authors[0] if len(song.authors) > 0 else ""
+    return f"{normalize_query(song.name)}:{normalize_query(artist)}"
+
+
+class CachedMusicApi(MusicApi):
+    """Wraps any music api and caches its search results on disk"""
+
+    _api: MusicApi
+    _cache: SearchCache
+
+    def __init__(self, api: MusicApi, cache: SearchCache) -> None:
+        super().__init__()
+        self._api = api
+        self._cache = cache
+
+    @property
+    def name(self) -> str:
+        return self._api.name
+
+    @property
+    def limiter(self) -> ratelimit.RateLimiter:
+        """Returns the limiter of the wrapped api, whose rates it was made with"""
+        return self._api.limiter
+
+    @property
+    def cache(self) -> SearchCache:
+        """Returns underlying cache"""
+        return self._cache
+
+    def get_api(self) -> MusicApi:
+        """Returns wrapped api"""
+        return self._api
+
+    def search_song(self, song: Song) -> list[Song]:
+        """Search for a song based on name/author, using cached results if present"""
+        key = f"{self.name}:search:{search_query(song)}"
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            return [Song.from_dict(s) for s in cached]
+
+        songs = self._api.search_song(song)
+        self._cache.set(key, [s.to_dict() for s in songs])
+        return songs
+
+    def search_song_id(self, song_id: str) -> Song | None:
+        """Finds a track using its id, using cached result if present"""
+        key = f"{self.name}:id:{song_id}"
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            return Song.from_dict(cached)
+
+        song = self._api.search_song_id(song_id)
+        if song is not None:
+            self._cache.set(key, song.to_dict())
+        return song
+
+    def search_song_isrc(self, isrc: str) -> Song | None:
+        """Finds a track by its ISRC, using cached result if present"""
+        key = f"{self.name}:isrc:{isrc}"
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            return Song.from_dict(cached)
+
+        song = self._api.search_song_isrc(isrc)
+        if song is not None:
+            self._cache.set(key, song.to_dict())
+        return song
+
+    def search_album_songs(self, album: str, artist: str) -> list[Song]:
+        """Returns tracklist of an album, using cached result if present"""
+        key = f"{self.name}:album:{normalize_query(album)}:{normalize_query(artist)}"
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            return [Song.from_dict(s) for s in cached]
+
+        songs = self._api.search_album_songs(album, artist)
+        self._cache.set(key, [s.to_dict() for s in songs])
+        return songs
+
+    def search_artist_songs(self, artist: str) -> list[Song]:
+        """Returns catalog of an artist, using cached result if present"""
+        key = f"{self.name}:artist:{normalize_query(artist)}"
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            return [Song.from_dict(s) for s in cached]
+
+        songs = self._api.search_artist_songs(artist)
+        self._cache.set(key, [s.to_dict() for s in songs])
+        return songs
+
+    def cached_songs(self) -> list[Song]:
+        """Returns every song found by cached searches, for offline re-scoring"""
+        unique: dict[str, Song] = {}
+        for entry in self._cache.values(f"{self.name}:search:"):
+            for s in entry:
+                if s["id"] not in unique:
+                    unique[s["id"]] = Song.from_dict(s)
+        return list(unique.values())
+
+    def get_user_playlists(self) -> list[Playlist]:
+        """Playlists change often, so they are never cached"""
+        return self._api.get_user_playlists()
+
+    def __getattr__(self, attr: str):
+        # forward api specific methods (add_song_by_id, get_liked_songs, ...)
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self._api, attr)
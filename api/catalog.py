@@ -0,0 +1,129 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from classes import Song, MusicApi
+from utils import logger, possibility, similarity, slugify_cached
+from utils.metrics import METRICS
+from utils.ratelimit import RateLimitExceeded
+from .mapper import select_best
+
+# requests a catalog takes at deezer's defaults: the artist search, its top tracks,
+# its albums and 5 album tracklists. A matched song saves at least one search
+CATALOG_CALLS = 8
+# prefetch only when half the songs being found already pays for the catalog
+MIN_ARTIST_SONGS = 2 * CATALOG_CALLS
+
+
+class ArtistCatalog:
+    """Prefetched tracks of artists, indexed by artist and normalized title"""
+
+    _index: dict[str, dict[str, list[Song]]]
+
+    def __init__(self) -> None:
+        self._index = {}
+
+    @property
+    def artists(self) -> int:
+        """Returns amount of artists in the index"""
+        return len(self._index)
+
+    def add(self, artist: str, songs: list[Song]) -> None:
+        """Indexes tracks of an artist under every name variant of their titles"""
+        titles = self._index.setdefault(slugify_cached(artist), {})
+        for song in songs:
+            formatted = possibility.format_song(song)
+            for name in possibility.get_possible_names(formatted):
+                entries = titles.setdefault(slugify_cached(name), [])
+                if formatted not in entries:
+                    entries.append(formatted)
+
+    def has(self, artist: str) -> bool:
+        """Returns True if tracks of the artist were prefetched"""
+        return slugify_cached(artist) in self._index
+
+    def lookup(self, artist: str, song: Song) -> list[Song]:
+        """Returns tracks of the artist sharing one of the song's names"""
+        titles = self._index.get(slugify_cached(artist))
+        if titles is None:
+            return []
+        found: dict[str, Song] = {}
+        for name in possibility.get_possible_names(song):
+            for candidate in titles.get(slugify_cached(name), []):
+                found.setdefault(candidate.id, candidate)
+        return list(found.values())
+
+
+def hot_artists(songs: list[Song], min_songs: int = MIN_ARTIST_SONGS) -> list[str]:
+    """Returns primary artists with at least min_songs songs, most frequent first"""
+    counts: Counter[str] = Counter()
+    names: dict[str, str] = {}
+    for song in songs:
+        if len(song.authors) == 0:
+            continue
+        key = slugify_cached(song.authors[0])
+        if key == "":
+            continue
+        counts[key] += 1
+        names.setdefault(key, song.authors[0])
+    return [names[key] for (key, count) in counts.most_common() if count >= min_songs]
+
+
+def find_songs_by_artist(
+    songs: list[Song],
+    api: MusicApi,
+    min_songs: int = MIN_ARTIST_SONGS,
+    workers: int = 4,
+    on_result: Callable[[similarity.MatchResult], None] | None = None,
+) -> list[Song]:
+    """
+    Prefetches catalogs of artists with at least min_songs songs and matches
+    their songs against it, returning songs still to be searched one by one
+    """
+    artists = hot_artists(songs, min_songs)
+    catalog = ArtistCatalog()
+
+    def prefetch(artist: str) -> tuple[str, list[Song]]:
+        try:
+            tracks = api.search_artist_songs(artist)
+        except RateLimitExceeded:
+            # the songs are searched one by one instead, which retries throttling
+            logger.log_warning(f"Throttled fetching catalog of {artist}, skipping it")
+            return artist, []
+        except Exception as exc:
+            logger.log_error(f"Failed fetching catalog of {artist}: {exc}")
+            return artist, []
+        METRICS.inc("artist_lookups_total", result="hit" if len(tracks) > 0 else "miss")
+        return artist, tracks
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for artist, tracks in executor.map(prefetch, artists):
+            if len(tracks) > 0:
+                catalog.add(artist, tracks)
+
+    leftovers: list[Song] = []
+    for index, song in enumerate(songs):
+        if len(song.authors) == 0 or not catalog.has(song.authors[0]):
+            leftovers.append(song)
+            continue
+        formatted = possibility.format_song(song)
+        matcher = similarity.SongMatcher(formatted)
+        matcher.add(catalog.lookup(song.authors[0], formatted))
+        found = matcher.result
+        if len(found.identical) == 0:
+            leftovers.append(song)
+            continue
+        _, chosen = select_best(found, index + 1)
+        result = similarity.MatchResult(song, found, chosen)
+        METRICS.inc("songs_matched_total", tier=result.tier)
+        if on_result is not None:
+            on_result(result)
+
+    matched = len(songs) - len(leftovers)
+    spent = len(artists) * CATALOG_CALLS
+    logger.log_message(
+        f"Artists: {catalog.artists} of {len(artists)} catalogs prefetched, "
+        + f"{matched} matched, {len(leftovers)} left to search "
+        + f"(~{matched - spent} calls saved: {matched} searches for ~{spent} requests)"
+    )
+    return leftovers
@@ -1,20 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+import itertools
 import deezer
 
 from classes import Song, MusicApi
 from classes.playlist import Playlist
-from utils import logger
+from utils import logger, slugify_cached
+
+# deezer's default page size, so a capped search costs a single request
+SEARCH_LIMIT = 25
+# deezer's largest page size, for full listings
+PAGE_SIZE = 100
 
 
 class DeezerApiException(Exception):
     """A simple deezer exception"""
 
 
+class AddStatus(Enum):
+    """Outcome of adding a single track to the library"""
+
+    ADDED = "added"
+    ALREADY_ADDED = "already in library"
+    DUPLICATE = "duplicate"
+    FAILED = "failed"
+
+
+class AddOutcome:
+    """Result of adding a single track to the library"""
+
+    _song_id: str
+    _status: AddStatus
+    _error: str | None
+
+    def __init__(self, song_id: str, status: AddStatus, error: str | None = None):
+        self._song_id = song_id
+        self._status = status
+        self._error = error
+
+    @property
+    def song_id(self) -> str:
+        """Returns track id"""
+        return self._song_id
+
+    @property
+    def status(self) -> AddStatus:
+        """Returns outcome status"""
+        return self._status
+
+    @property
+    def error(self) -> str | None:
+        """Returns error message for failed tracks"""
+        return self._error
+
+    def __str__(self) -> str:
+        base = f"TRACK {self.song_id}: {self.status.value}"
+        return base if self.error is None else f"{base} ({self.error})"
+
+
+class AddReport:
+    """Per-track outcomes of a bulk add, in input order"""
+
+    _outcomes: list[AddOutcome]
+
+    def __init__(self, outcomes: list[AddOutcome]) -> None:
+        self._outcomes = outcomes
+
+    @property
+    def outcomes(self) -> list[AddOutcome]:
+        """Returns every outcome"""
+        return self._outcomes
+
+    def with_status(self, status: AddStatus) -> list[AddOutcome]:
+        """Returns outcomes with given status"""
+        return [o for o in self._outcomes if o.status == status]
+
+    def __str__(self) -> str:
+        counts = ", ".join(
+            f"{len(self.with_status(status))} {status.value}" for status in AddStatus
+        )
+        return f"ADDED {len(self._outcomes)} tracks: {counts}"
+
+
 class DeezerApiConverter:
     """A helper class for parsing"""
 
     @staticmethod
-    def song_from_track(track: deezer.Track) -> Song:
-        """Converts deezer.Track into a Song"""
+    def song_from_track(track: deezer.Track, album: str | None = None) -> Song:
+        """
+        Converts deezer.Track into a Song.
+        Album tracklists leave the album out of their tracks, so it can be passed
+        """
 
         artist = track.artist.name
         if isinstance(artist, str):
@@ -27,7 +103,10 @@ class DeezerApiConverter:
             track.title,
             artist,
             track.duration,
-            track.album.title,
+            album if album is not None else track.album.title,
+            "Deezer",
+            # vars, since a missing attribute would make the client fetch the track
+            vars(track).get("isrc"),
         )
 
 
@@ -35,6 +114,9 @@ class DeezerApi(MusicApi):
     """Wraps deezer api"""
 
     _client: deezer.Client
+    # https://developers.deezer.com/termsofuse: 50 requests / 5 seconds
+    _rate: float = 10.0
+    _max_rate: float = 10.0
 
     def __init__(self, access_token="") -> None:
         super().__init__()
@@ -48,7 +130,16 @@ class DeezerApi(MusicApi):
         """Search for a song based on name/author"""
         songs: set[Song] = set()
 
-        result = self.get_client().search(song.name, artist=song.authors[0])
+        # calls take what they send as arguments, so identical ones can be coalesced
+        def search(name: str, artist: str) -> list:
+            # only the first page: one request per token, the match is near the top
+            return list(
+                itertools.islice(
+                    self.get_client().search(name, artist=artist), SEARCH_LIMIT
+                )
+            )
+
+        result = self._call(search, song.name, song.authors[0])
         for entry in result:
             parsed = DeezerApiConverter.song_from_track(entry)
             if parsed is not None:
@@ -60,13 +151,182 @@ class DeezerApi(MusicApi):
 
     def search_song_id(self, song_id: str) -> Song | None:
         int_id = int(song_id)
-        result = self.get_client().get_track(int_id)
+        result = self._call(self.get_client().get_track, int_id)
+        return DeezerApiConverter.song_from_track(result)
+
+    def search_song_isrc(self, isrc: str) -> Song | None:
+        """Finds a track by its ISRC with a single lookup"""
+        try:
+            result = self._call(self.get_client().get_track, f"isrc:{isrc}")
+        except deezer.exceptions.DeezerErrorResponse:
+            return None
         return DeezerApiConverter.song_from_track(result)
 
+    def search_album_songs(self, album: str, artist: str) -> list[Song]:
+        """Finds an album by name and artist, returning its whole tracklist"""
+
+        def search(album: str, artist: str) -> list:
+            # only the first page, the album is either near the top or not there
+            return list(
+                itertools.islice(
+                    self.get_client().search(album=album, artist=artist), SEARCH_LIMIT
+                )
+            )
+
+        wanted = slugify_cached(album)
+        tracks = self._call(search, album, artist)
+        found = next(
+            (t.album for t in tracks if slugify_cached(t.album.title) == wanted),
+            None,
+        )
+        if found is None:
+            return []
+
+        album_tracks, _ = self._get_pages(f"album/{found.id}/tracks")
+        return [
+            DeezerApiConverter.song_from_track(t, found.title) for t in album_tracks
+        ]
+
+    def search_artist_songs(
+        self, artist: str, top: int = 50, max_albums: int = 5
+    ) -> list[Song]:
+        """
+        Finds an artist by name, returning its top tracks
+        and tracklists of its first max_albums albums
+        """
+
+        def search(artist: str) -> list:
+            return list(itertools.islice(self.get_client().search_artists(artist), 10))
+
+        wanted = slugify_cached(artist)
+        found = next(
+            (a for a in self._call(search, artist) if slugify_cached(a.name) == wanted),
+            None,
+        )
+        if found is None:
+            return []
+
+        top_tracks, _ = self._get_pages(f"artist/{found.id}/top", limit=top)
+        albums, _ = self._get_pages(f"artist/{found.id}/albums", limit=max_albums)
+        songs = [DeezerApiConverter.song_from_track(t) for t in top_tracks]
+        for album in albums:
+            album_tracks, _ = self._get_pages(f"album/{album.id}/tracks")
+            songs.extend(
+                DeezerApiConverter.song_from_track(t, album.title) for t in album_tracks
+            )
+        return songs
+
     def add_song_by_id(self, song_id: str) -> bool:
         """Adds song by id"""
         int_id = int(song_id)
-        return self.get_client().add_user_track(int_id)
+        return self._call(self.get_client().add_user_track, int_id)
+
+    def remove_song_by_id(self, song_id: str) -> bool:
+        """Removes song from the user's favorites by id"""
+        int_id = int(song_id)
+        return self._call(self.get_client().remove_user_track, int_id)
+
+    def add_songs_by_ids(
+        self,
+        song_ids: list[str],
+        workers: int = 8,
+        favorites: set[str] | None = None,
+    ) -> AddReport:
+        """
+        Adds many songs concurrently (under the rate limit).
+        Tracks already in the user's favorites and repeated ids are skipped.
+        Pass favorites to reuse them across calls, added ids are put into it
+        """
+        if favorites is None:
+            favorites = self.get_favorite_ids()
+        outcomes: dict[int, AddOutcome] = {}
+        to_add: list[tuple[int, str]] = []
+        seen: set[str] = set()
+
+        for index, song_id in enumerate(song_ids):
+            if song_id in favorites:
+                outcomes[index] = AddOutcome(song_id, AddStatus.ALREADY_ADDED)
+            elif song_id in seen:
+                outcomes[index] = AddOutcome(song_id, AddStatus.DUPLICATE)
+            else:
+                seen.add(song_id)
+                to_add.append((index, song_id))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                self.try_add_song_by_id, [song_id for (_, song_id) in to_add]
+            )
+            for (index, _), outcome in zip(to_add, results):
+                outcomes[index] = outcome
+                if outcome.status == AddStatus.ADDED:
+                    favorites.add(outcome.song_id)
+
+        return AddReport([outcomes[i] for i in range(len(song_ids))])
+
+    def try_add_song_by_id(self, song_id: str) -> AddOutcome:
+        """Adds song by id, reporting errors in the outcome instead of raising"""
+        try:
+            if self.add_song_by_id(song_id):
+                return AddOutcome(song_id, AddStatus.ADDED)
+            return AddOutcome(song_id, AddStatus.FAILED, "rejected by deezer")
+        except Exception as exc:
+            return AddOutcome(song_id, AddStatus.FAILED, str(exc))
+
+    def get_favorite_ids(self) -> set[str]:
+        """Returns ids of every track in the user's favorites"""
+
+        tracks, _ = self._get_pages("user/me/tracks")
+        return {str(t.id) for t in tracks}
+
+    def get_favorite_songs(
+        self, known: set[str] | None = None
+    ) -> tuple[list[Song], list[str], int]:
+        """
+        Returns favorites in the order deezer lists them (latest first), and their
+        total count. With known ids, stops at the first known track so only pages
+        holding new additions are fetched, also returning ids of the known tracks
+        that followed it on that page (to check them against an earlier snapshot)
+        """
+        fresh: list = []
+        while True:
+            page, total, more = self._call(
+                self._get_page, "user/me/tracks", len(fresh), PAGE_SIZE
+            )
+            for position, track in enumerate(page):
+                if known is not None and str(track.id) in known:
+                    rest = [str(t.id) for t in page[position:]]
+                    return self._favorite_songs(fresh), rest, total
+                fresh.append(track)
+            if not more or len(page) == 0:
+                return self._favorite_songs(fresh), [], total
+
+    @staticmethod
+    def _favorite_songs(tracks: list) -> list[Song]:
+        return [DeezerApiConverter.song_from_track(t) for t in tracks]
+
+    def _get_page(self, path: str, index: int, limit: int) -> tuple[list, int, bool]:
+        """Fetches one page of a listing: its items, the listing's total, if more follow"""
+        payload = self.get_client().request(
+            "GET", path, paginate_list=True, params={"index": index, "limit": limit}
+        )
+        data = payload["data"]
+        total = payload.get("total", index + len(data))
+        return data, total, payload.get("next") is not None
+
+    def _get_pages(self, path: str, limit: int | None = None) -> tuple[list, int]:
+        """
+        Fetches a paginated listing one page (and one limiter token) at a time,
+        up to limit items. Returns the items and the listing's total size
+        """
+        items: list = []
+        total = 0
+        while limit is None or len(items) < limit:
+            size = PAGE_SIZE if limit is None else min(PAGE_SIZE, limit - len(items))
+            page, total, more = self._call(self._get_page, path, len(items), size)
+            items.extend(page)
+            if not more or len(page) == 0:
+                break
+        return items, total
 
     def get_client(self) -> deezer.Client:
         """Returns underlying client"""
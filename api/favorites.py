@@ -0,0 +1,155 @@
+from typing import Callable
+import time
+
+from classes import Song
+from utils import filemanager, logger, possibility, similarity, slugify_cached
+from utils.metrics import METRICS
+from utils.parallel import compact
+from .deezer import DeezerApi
+from .mapper import select_best
+
+# durations closer than this count as the same (see similarity.have_similar_duration)
+DURATION_BUCKET = 3
+
+
+def favorite_keys(song: Song, author: str, bucket: int) -> list[str]:
+    """Returns (title, author slug, duration bucket) keys of a formatted song"""
+    return [
+        f"{slugify_cached(name)}:{author}:{bucket}"
+        for name in possibility.get_possible_names(song)
+    ]
+
+
+class FavoritesIndex:
+    """
+    Local snapshot of the user's deezer favorites, indexed by normalized
+    title, main artist and duration bucket. Refreshes incrementally: only tracks
+    added since the last snapshot are fetched, unless the count stops adding up,
+    known tracks on the last fetched page are not where the snapshot has them
+    or the snapshot is older than full_every seconds
+    """
+
+    _path: str | None
+    _tracks: dict[str, Song]
+    _keys: dict[str, list[Song]]
+    _fetched_at: float
+    _full_every: float
+
+    def __init__(
+        self, path: str | None = "favorites.json", full_every: float = 24 * 3600
+    ) -> None:
+        self._path = path
+        self._tracks = {}
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._full_every = full_every
+
+        if path is not None and filemanager.does_file_exist(path):
+            data = filemanager.read_json_file(path)
+            self._fetched_at = data.get("fetched_at", 0.0)
+            # (id, name, authors, duration, album, provider), the Song argument order
+            self._set_tracks([Song(*t) for t in data.get("tracks", [])])
+
+    def _set_tracks(self, songs: list[Song]) -> None:
+        self._tracks = {s.id: s for s in songs}
+        self._keys = {}
+        for song in self._tracks.values():
+            formatted = possibility.format_song(song)
+            if formatted.duration is None or len(formatted.authors) == 0:
+                continue
+            # deezer tracks carry their main artist only
+            author = slugify_cached(formatted.authors[0])
+            bucket = formatted.duration // DURATION_BUCKET
+            for key in favorite_keys(formatted, author, bucket):
+                self._keys.setdefault(key, []).append(formatted)
+
+    def refresh(self, api: DeezerApi) -> None:
+        """Brings the snapshot up to date with the user's favorites"""
+        stale = time.time() - self._fetched_at > self._full_every
+        known = set(self._tracks) if len(self._tracks) > 0 and not stale else None
+        fresh, rest, total = api.get_favorite_songs(known)
+        order = list(self._tracks)
+        if known is not None and (
+            len(known) + len(fresh) != total or rest != order[: len(rest)]
+        ):
+            # tracks were removed (or listed in another order), start over
+            logger.log_warning("Favorites changed beyond new additions, refetching")
+            known = None
+            fresh, _, total = api.get_favorite_songs()
+
+        previous = [] if known is None else list(self._tracks.values())
+        self._set_tracks(fresh + previous)
+        self._fetched_at = time.time()
+        logger.log_message(f"{self} ({len(fresh)} fetched)")
+
+    @property
+    def ids(self) -> set[str]:
+        """Returns ids of every favorite in the snapshot"""
+        return set(self._tracks)
+
+    def lookup(self, song: Song) -> Song | None:
+        """Returns the favorite identical to a formatted song, None if there is none"""
+        if song.duration is None:
+            return None
+        key = song.normalized
+        bucket = song.duration // DURATION_BUCKET
+        # any author of the song may be the one deezer lists as the main artist
+        for author in key.authors:
+            for near in (bucket, bucket - 1, bucket + 1):
+                for name_key in favorite_keys(song, author, near):
+                    for favorite in self._keys.get(name_key, []):
+                        if similarity.compare(key, favorite.normalized) == "identical":
+                            return favorite
+        return None
+
+    def save(self) -> None:
+        """Persists the snapshot for the next run"""
+        if self._path is None:
+            return
+        tracks = [[*compact(s), s.provider] for s in self._tracks.values()]
+        filemanager.create_json_file(
+            self._path, {"fetched_at": self._fetched_at, "tracks": tracks}
+        )
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def __str__(self) -> str:
+        return (
+            f"FAVORITES INDEX (path: {self._path} | tracks: {len(self._tracks)} "
+            + f"| keys: {len(self._keys)})"
+        )
+
+
+def find_songs_in_favorites(
+    songs: list[Song],
+    favorites: FavoritesIndex,
+    on_result: Callable[[similarity.MatchResult], None] | None = None,
+) -> list[Song]:
+    """
+    Resolves songs already in the user's favorites without searching,
+    returning songs still to be searched
+    """
+    leftovers: list[Song] = []
+    for index, song in enumerate(songs):
+        formatted = possibility.format_song(song)
+        favorite = favorites.lookup(formatted)
+        METRICS.inc(
+            "favorites_lookups_total", result="hit" if favorite is not None else "miss"
+        )
+        if favorite is None:
+            leftovers.append(song)
+            continue
+        found = similarity.SimilarSongs(formatted)
+        found.add_identical(favorite)
+        _, chosen = select_best(found, index + 1)
+        result = similarity.MatchResult(song, found, chosen)
+        METRICS.inc("songs_matched_total", tier=result.tier)
+        if on_result is not None:
+            on_result(result)
+
+    logger.log_message(
+        f"Favorites: {len(songs) - len(leftovers)} of {len(songs)} songs "
+        + f"already there, {len(leftovers)} left to search"
+    )
+    return leftovers
@@ -1,65 +1,466 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from typing import AsyncIterator, Callable
+import asyncio
+import multiprocessing
+import time
 
 from classes import Song, MusicApi
-from utils import logger, possibility, similarity
+from utils import logger, parallel, possibility, similarity
+from utils.metrics import METRICS
+from utils.planner import QueryPlanner
+from utils.ratelimit import RateLimitExceeded
+
+STAGE_METRIC = "match_stage_seconds"
+# a throttled song is retried this many times, waiting attempt * cooldown seconds,
+# before it is left out of the results for a --resume run to pick up
+THROTTLE_RETRIES = 3
+THROTTLE_COOLDOWN = 5.0
 
 
 def find_songs_sync(songs: list[Song], api: MusicApi) -> dict[str, list[Song]]:
     """Finds songs in an api"""
     mapped: dict[str, list[Song]] = {}
     for index, song in enumerate(songs):
-        try:
-            song_id, found_songs = find_song(song, index + 1, api)
-        except Exception as exc:
-            print(f"{song} generated an exception: {exc}")
-        else:
-            mapped[song_id] = found_songs
+        for attempt in range(THROTTLE_RETRIES + 1):
+            try:
+                song_id, found_songs = find_song(song, index + 1, api)
+            except RateLimitExceeded:
+                if attempt == THROTTLE_RETRIES:
+                    log_throttled(index + 1, song)
+                else:
+                    time.sleep((attempt + 1) * THROTTLE_COOLDOWN)
+                continue
+            except Exception as exc:
+                print(f"{song} generated an exception: {exc}")
+            else:
+                mapped[song_id] = found_songs
+            break
     return mapped
 
 
 def find_songs_async(
-    songs: list[Song], api: MusicApi, workers: int = 2
+    songs: list[Song],
+    api: MusicApi,
+    workers: int = 16,
+    variants: int = 1,
+    on_result: Callable[[similarity.MatchResult], None] | None = None,
+    planner: QueryPlanner | None = None,
 ) -> dict[str, list[Song]]:
-    """Finds songs in an api async"""
+    """
+    Finds songs in an api async, with at most 'workers' requests in flight.
+    on_result is called with every result as soon as it is ready
+    """
+
+    async def collect() -> dict[str, list[Song]]:
+        mapped: dict[str, list[Song]] = {}
+        stream = find_songs_stream(songs, api, workers, variants, planner=planner)
+        async for result in stream:
+            mapped[result.source.id] = result.chosen
+            if on_result is not None:
+                on_result(result)
+        return mapped
+
+    return asyncio.run(collect())
+
+
+def find_songs_parallel(
+    songs: list[Song],
+    api: MusicApi,
+    processes: int | None = None,
+    workers: int = 16,
+    chunk_size: int = 32,
+    on_result: Callable[[similarity.MatchResult], None] | None = None,
+    planner: QueryPlanner | None = None,
+) -> dict[str, list[Song]]:
+    """
+    Finds songs in an api, formatting and scoring candidates in worker processes.
+    Searches stay in this process ('workers' at once), one name variant per song
+    per round, and songs with an identical match sit out the next rounds,
+    like in the variant loop of find_song. Candidates of 'chunk_size' songs
+    are shipped to workers as soon as their searches are done
+    """
+    formatted = [possibility.format_song(s) for s in songs]
+    plans = [plan_variants(s, planner) for s in formatted]
+    matchers = [similarity.SongMatcher(s) for s in formatted]
     mapped: dict[str, list[Song]] = {}
 
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        future_mappings = {
-            executor.submit(find_song, song, index + 1, api): (index, song)
-            for (index, song) in enumerate(songs)
+    def search(index: int, name: str) -> list[Song]:
+        with METRICS.timer(STAGE_METRIC, stage="search"):
+            return api.search_song(formatted[index].with_name(name))
+
+    def finish(index: int) -> None:
+        found = matchers[index].result
+        if planner is not None:
+            planner.finish(len(found.identical) > 0)
+        with METRICS.timer(STAGE_METRIC, stage="select"):
+            _, chosen = select_best(found, index + 1)
+        result = similarity.MatchResult(songs[index], found, chosen)
+        METRICS.inc("songs_matched_total", tier=result.tier)
+        mapped[result.source.id] = result.chosen
+        if on_result is not None:
+            on_result(result)
+
+    # fork would copy locks held by search threads, so workers start fresh
+    context = multiprocessing.get_context("spawn")
+    with ThreadPoolExecutor(max_workers=workers) as searcher, ProcessPoolExecutor(
+        max_workers=processes, mp_context=context
+    ) as scorer:
+        lookups = {
+            searcher.submit(find_by_isrc, song, api): index
+            for (index, song) in enumerate(formatted)
+            if song.isrc is not None
         }
-        for future in as_completed(future_mappings):
-            url = future_mappings[future]
+        for lookup in as_completed(lookups):
             try:
-                song_id, found_songs = future.result()
-            except Exception as exc:
-                print(f"{url} generated an exception: {exc}")
-            else:
-                mapped[song_id] = found_songs
+                isrc_match = lookup.result()
+            except RateLimitExceeded:
+                # searching by name still gets a chance to find it
+                continue
+            if isrc_match is not None:
+                matchers[lookups[lookup]].add_scored(
+                    possibility.format_song(isrc_match), "identical"
+                )
+
+        active: list[int] = []
+        for index, matcher in enumerate(matchers):
+            if len(matcher.result.identical) > 0:
+                finish(index)
+            elif len(plans[index]) > 0:
+                active.append(index)
+        # next variant of every song, and how often its current one was throttled
+        variants = [0] * len(songs)
+        throttles = [0] * len(songs)
+        while len(active) > 0:
+            searches = {
+                searcher.submit(search, index, plans[index][variants[index]][1]): index
+                for index in active
+            }
+            throttled: set[int] = set()
+            scoring: list[tuple[Future, list[tuple[int, list[Song]]]]] = []
+            chunk: list[tuple[int, list[Song]]] = []
+
+            def ship() -> None:
+                tasks = [
+                    (
+                        parallel.compact(formatted[index]),
+                        [parallel.compact(s) for s in new],
+                    )
+                    for (index, new) in chunk
+                ]
+                scoring.append(
+                    (scorer.submit(parallel.score_tasks, tasks), list(chunk))
+                )
+                chunk.clear()
+
+            for future in as_completed(searches):
+                index = searches[future]
+                try:
+                    candidates = future.result()
+                except RateLimitExceeded:
+                    # the same variant is searched again next round
+                    throttled.add(index)
+                    continue
+                except Exception as exc:
+                    logger.log_error(
+                        f"{index + 1}: Failed {formatted[index].pretty()}: {exc}"
+                    )
+                    continue
+                chunk.append((index, unseen_candidates(matchers[index], candidates)))
+                if len(chunk) >= chunk_size:
+                    ship()
+            if len(chunk) > 0:
+                ship()
+
+            with METRICS.timer(STAGE_METRIC, stage="score"):
+                for scored, shipped in scoring:
+                    for (index, new), buckets in zip(shipped, scored.result()):
+                        tiers = dict(buckets)
+                        for find in new:
+                            tier = tiers.get(find.id)
+                            # only candidates that made it into a bucket are kept formatted
+                            if tier is not None:
+                                find = possibility.format_song(find)
+                            matchers[index].add_scored(find, tier)
+
+            next_active: list[int] = []
+            for index in active:
+                if index in throttled:
+                    throttles[index] += 1
+                    if throttles[index] <= THROTTLE_RETRIES:
+                        next_active.append(index)
+                    else:
+                        log_throttled(index + 1, songs[index])
+                    continue
+                variant = variants[index]
+                matched = len(matchers[index].result.identical) > 0
+                if planner is not None:
+                    planner.record(plans[index][variant][0], matched)
+                if not matched and variant + 1 < len(plans[index]):
+                    variants[index] += 1
+                    throttles[index] = 0
+                    next_active.append(index)
+                else:
+                    finish(index)
+            active = next_active
+            if len(throttled) > 0 and len(active) > 0:
+                time.sleep(max(throttles) * THROTTLE_COOLDOWN)
+
     return mapped
 
 
-def find_song(song: Song, index: int, api: MusicApi) -> tuple[str, list[Song]]:
+async def find_songs_stream(
+    songs: list[Song],
+    api: MusicApi,
+    concurrency: int = 16,
+    variants: int = 1,
+    window: int | None = None,
+    planner: QueryPlanner | None = None,
+) -> AsyncIterator[similarity.MatchResult]:
+    """
+    Finds songs in an api, yielding each result as soon as it is ready.
+    concurrency caps requests in flight overall, variants caps them per song.
+    At most 'window' songs (default 4 * concurrency) are being matched at once,
+    and new ones only start as results are consumed, so a slow consumer
+    slows matching down instead of letting results pile up
+    """
+    if concurrency < 1:
+        raise ValueError("Concurrency must be greater than 0")
+    if variants < 1:
+        raise ValueError("Variants must be greater than 0")
+    if window is None:
+        window = 4 * concurrency
+    if window < 1:
+        raise ValueError("Window must be greater than 0")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    pending_songs = iter(enumerate(songs))
+    tasks: dict[asyncio.Task, tuple[int, Song, int]] = {}
+    # (ready at, index, song, attempt) of throttled songs waiting to be retried
+    throttled: list[tuple[float, int, Song, int]] = []
+
+    def start(index: int, song: Song, attempt: int) -> None:
+        task = asyncio.create_task(
+            find_song_async(
+                song, index + 1, api, semaphore, executor, variants, planner
+            )
+        )
+        tasks[task] = (index, song, attempt)
+
+    def schedule() -> None:
+        now = time.monotonic()
+        for retry in [e for e in throttled if e[0] <= now]:
+            if len(tasks) >= window:
+                break
+            throttled.remove(retry)
+            start(*retry[1:])
+        while len(tasks) < window:
+            pending = next(pending_songs, None)
+            if pending is None:
+                break
+            start(pending[0], pending[1], 0)
+        METRICS.set_gauge("match_window_depth", len(tasks))
+
+    try:
+        schedule()
+        while len(tasks) > 0 or len(throttled) > 0:
+            if len(tasks) == 0:
+                await asyncio.sleep(min(e[0] for e in throttled) - time.monotonic())
+                schedule()
+                continue
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, song, attempt = tasks.pop(task)
+                try:
+                    result = task.result()
+                except RateLimitExceeded:
+                    if attempt < THROTTLE_RETRIES:
+                        ready = time.monotonic() + (attempt + 1) * THROTTLE_COOLDOWN
+                        throttled.append((ready, index, song, attempt + 1))
+                    else:
+                        log_throttled(index + 1, song)
+                except Exception as exc:
+                    logger.log_error(f"Matching generated an exception: {exc}")
+                else:
+                    yield result
+                schedule()
+    finally:
+        for task in tasks:
+            task.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def find_song_async(
+    song: Song,
+    index: int,
+    api: MusicApi,
+    semaphore: asyncio.Semaphore,
+    executor: ThreadPoolExecutor,
+    variants: int = 1,
+    planner: QueryPlanner | None = None,
+) -> similarity.MatchResult:
+    """
+    Finds a song in an api, querying up to 'variants' name variants concurrently.
+    Variants still waiting for a slot are cancelled once an identical match is found
+    """
+    source = song
+    with METRICS.timer(STAGE_METRIC, stage="format"):
+        song = possibility.format_song(song)
+    matcher = similarity.SongMatcher(song)
+    loop = asyncio.get_running_loop()
+
+    async def search(name: str) -> list[Song]:
+        async with semaphore:
+            with METRICS.timer(STAGE_METRIC, stage="search"):
+                return await loop.run_in_executor(
+                    executor,
+                    api.search_song,
+                    song.with_name(name),
+                )
+
+    isrc_match = None
+    if song.isrc is not None:
+        async with semaphore:
+            isrc_match = await loop.run_in_executor(executor, find_by_isrc, song, api)
+    if isrc_match is not None:
+        matcher.add_scored(possibility.format_song(isrc_match), "identical")
+
+    pending_variants = plan_variants(song, planner) if isrc_match is None else []
+    queries: dict[asyncio.Task, str] = {}
+    try:
+        while len(pending_variants) > 0 or len(queries) > 0:
+            while len(pending_variants) > 0 and len(queries) < variants:
+                kind, name = pending_variants.pop(0)
+                queries[asyncio.create_task(search(name))] = kind
+
+            done, _ = await asyncio.wait(queries, return_when=asyncio.FIRST_COMPLETED)
+            for query in done:
+                kind = queries.pop(query)
+                try:
+                    add_candidates(matcher, query.result())
+                except RateLimitExceeded:
+                    # never report a throttled song as lost, the driver retries it
+                    raise
+                except Exception as exc:
+                    logger.log_error(f"{index}: Failed {song.pretty()}: {exc}")
+                if planner is not None:
+                    planner.record(kind, len(matcher.result.identical) > 0)
+
+            if len(matcher.result.identical) > 0:
+                break
+    finally:
+        for query in queries:
+            query.cancel()
+
+    found = matcher.result
+    if planner is not None:
+        planner.finish(len(found.identical) > 0)
+    with METRICS.timer(STAGE_METRIC, stage="select"):
+        _, chosen = select_best(found, index)
+    result = similarity.MatchResult(source, found, chosen)
+    METRICS.inc("songs_matched_total", tier=result.tier)
+    return result
+
+
+def find_song(
+    song: Song, index: int, api: MusicApi, planner: QueryPlanner | None = None
+) -> tuple[str, list[Song]]:
     """Finds a song in an api"""
-    song = possibility.format_song(song)
-    names = possibility.get_possible_names(song)
-    all_candidates: set[Song] = set()
-    best_candidates = similarity.SimilarSongs(song)
+    with METRICS.timer(STAGE_METRIC, stage="format"):
+        song = possibility.format_song(song)
+    matcher = similarity.SongMatcher(song)
+
+    isrc_match = find_by_isrc(song, api)
+    if isrc_match is not None:
+        matcher.add_scored(possibility.format_song(isrc_match), "identical")
+    variants = plan_variants(song, planner) if isrc_match is None else []
 
-    for new_name in names:
+    for kind, new_name in variants:
         try:
-            new_candidates = api.search_song(
-                Song(song.id, new_name, song.authors, song.duration, song.album)
-            )
-            all_candidates.update([possibility.format_song(s) for s in new_candidates])
+            with METRICS.timer(STAGE_METRIC, stage="search"):
+                new_candidates = api.search_song(song.with_name(new_name))
+            add_candidates(matcher, new_candidates)
+        except RateLimitExceeded:
+            # never report a throttled song as lost, the driver retries it
+            raise
         except Exception as exc:
             logger.log_error(f"{index}: Failed {song.pretty()}: {exc}")
 
-        best_candidates = similarity.find_best(song, list(all_candidates))
-        if len(best_candidates.identical) > 0:
+        matched = len(matcher.result.identical) > 0
+        if planner is not None:
+            planner.record(kind, matched)
+        if matched:
             break
 
-    return select_best(best_candidates, index)
+    if planner is not None:
+        planner.finish(len(matcher.result.identical) > 0)
+    with METRICS.timer(STAGE_METRIC, stage="select"):
+        return select_best(matcher.result, index)
+
+
+def log_throttled(index: int, song: Song) -> None:
+    """Reports a song that stayed throttled, so it has no result for now"""
+    METRICS.inc("songs_throttled_total")
+    logger.log_error(
+        f"{index}: Throttled {song.pretty()}, left for a --resume run to retry"
+    )
+
+
+def add_candidates(matcher: similarity.SongMatcher, candidates: list[Song]) -> None:
+    """Formats and scores new candidates, timing both stages"""
+    with METRICS.timer(STAGE_METRIC, stage="format"):
+        formatted = format_new_candidates(matcher, candidates)
+    with METRICS.timer(STAGE_METRIC, stage="score"):
+        matcher.add(formatted)
+
+
+def find_by_isrc(song: Song, api: MusicApi) -> Song | None:
+    """Looks a song up by its ISRC, None if it has none or the api found nothing"""
+    if song.isrc is None:
+        return None
+    try:
+        found = api.search_song_isrc(song.isrc)
+    except RateLimitExceeded:
+        raise
+    except Exception as exc:
+        logger.log_error(f"ISRC lookup failed for {song.pretty()}: {exc}")
+        return None
+    METRICS.inc("isrc_lookups_total", result="miss" if found is None else "hit")
+    return found
+
+
+def plan_variants(song: Song, planner: QueryPlanner | None) -> list[tuple[str, str]]:
+    """Returns (kind, name) variants to query, in planner order if there is one"""
+    if planner is None:
+        return possibility.get_possible_variants(song)
+    return planner.plan(song)
+
+
+def unseen_candidates(
+    matcher: similarity.SongMatcher, candidates: list[Song]
+) -> list[Song]:
+    """Returns candidates the matcher has not seen yet, first of each id only"""
+    unseen: dict[str, Song] = {}
+    for s in candidates:
+        if s.id not in unseen and not matcher.has_candidate(s.id):
+            unseen[s.id] = s
+    return list(unseen.values())
+
+
+def format_new_candidates(
+    matcher: similarity.SongMatcher, candidates: list[Song]
+) -> list[Song]:
+    """Formats only candidates the matcher has not scored yet"""
+    return [
+        possibility.format_song(s)
+        for s in candidates
+        if not matcher.has_candidate(s.id)
+    ]
 
 
 def select_best(finds: similarity.SimilarSongs, index: int) -> tuple[str, list[Song]]:
@@ -0,0 +1,151 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+import asyncio
+import time
+
+from classes import Song, MusicApi
+from utils import logger
+from utils.metrics import METRICS
+from utils.planner import QueryPlanner
+from utils.similarity import MatchResult
+from .deezer import DeezerApi, AddOutcome, AddReport, AddStatus
+from .mapper import find_songs_stream
+
+
+class MigrationSummary:
+    """What a pipeline run matched and added"""
+
+    _results: list[MatchResult]
+    _report: AddReport
+    _elapsed: float
+    _max_queue_depth: int
+
+    def __init__(
+        self,
+        results: list[MatchResult],
+        report: AddReport,
+        elapsed: float,
+        max_queue_depth: int,
+    ) -> None:
+        self._results = results
+        self._report = report
+        self._elapsed = elapsed
+        self._max_queue_depth = max_queue_depth
+
+    @property
+    def results(self) -> list[MatchResult]:
+        """Returns every match result"""
+        return self._results
+
+    @property
+    def report(self) -> AddReport:
+        """Returns outcomes of every add"""
+        return self._report
+
+    @property
+    def elapsed(self) -> float:
+        """Returns wall-clock seconds the whole migration took"""
+        return self._elapsed
+
+    @property
+    def max_queue_depth(self) -> int:
+        """Returns the most matches ever waiting to be added"""
+        return self._max_queue_depth
+
+    def __str__(self) -> str:
+        tiers: dict[str, int] = {}
+        for result in self._results:
+            tiers[result.tier] = tiers.get(result.tier, 0) + 1
+        matched = ", ".join(f"{count} {tier}" for (tier, count) in tiers.items())
+        return (
+            f"MIGRATED {len(self._results)} songs in {self._elapsed:.1f}s "
+            + f"(matched: {matched} | max queue depth: {self._max_queue_depth})\n"
+            + str(self._report)
+        )
+
+
+async def migrate_songs(
+    songs: list[Song],
+    search_api: MusicApi,
+    target_api: DeezerApi,
+    concurrency: int = 16,
+    queue_size: int = 64,
+    add_workers: int = 4,
+    on_result: Callable[[MatchResult], None] | None = None,
+    planner: QueryPlanner | None = None,
+    on_added: Callable[[AddOutcome], None] | None = None,
+    favorite_ids: set[str] | None = None,
+) -> MigrationSummary:
+    """
+    Matches songs and adds identical matches to deezer favorites at the same time.
+    Matches go through a bounded queue: once add workers fall queue_size behind,
+    the matcher waits for them (backpressure). on_added gets every track put
+    into favorites as soon as it is there (from an add worker thread).
+    Pass favorite_ids when they are known already, to skip fetching them
+    """
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=add_workers)
+    queue: asyncio.Queue[str | None] = asyncio.Queue(maxsize=queue_size)
+
+    if favorite_ids is not None:
+        favorites = set(favorite_ids)
+    else:
+        favorites = await loop.run_in_executor(executor, target_api.get_favorite_ids)
+    queued: set[str] = set()
+    results: list[MatchResult] = []
+    outcomes: list[AddOutcome] = []
+    max_queue_depth = 0
+
+    async def produce() -> None:
+        nonlocal max_queue_depth
+        try:
+            stream = find_songs_stream(songs, search_api, concurrency, planner=planner)
+            async for result in stream:
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+
+                target_id = result.target_id
+                if result.tier != "identical" or target_id is None:
+                    continue
+                if target_id in favorites:
+                    outcomes.append(AddOutcome(target_id, AddStatus.ALREADY_ADDED))
+                elif target_id in queued:
+                    outcomes.append(AddOutcome(target_id, AddStatus.DUPLICATE))
+                else:
+                    queued.add(target_id)
+                    await queue.put(target_id)
+                    max_queue_depth = max(max_queue_depth, queue.qsize())
+                    METRICS.set_gauge("add_queue_depth", queue.qsize())
+        finally:
+            for _ in range(add_workers):
+                await queue.put(None)
+
+    def add(target_id: str) -> AddOutcome:
+        # reported from the worker, an add still running when interrupted counts too
+        outcome = target_api.try_add_song_by_id(target_id)
+        if on_added is not None and outcome.status == AddStatus.ADDED:
+            on_added(outcome)
+        return outcome
+
+    async def consume() -> None:
+        while True:
+            target_id = await queue.get()
+            if target_id is None:
+                return
+            METRICS.set_gauge("add_queue_depth", queue.qsize())
+            outcome = await loop.run_in_executor(executor, add, target_id)
+            if outcome.status == AddStatus.FAILED:
+                logger.log_error(str(outcome))
+            METRICS.inc("adds_total", status=outcome.status.name.lower())
+            outcomes.append(outcome)
+
+    try:
+        await asyncio.gather(produce(), *[consume() for _ in range(add_workers)])
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return MigrationSummary(
+        results, AddReport(outcomes), time.perf_counter() - start, max_queue_depth
+    )
@@ -1,3 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable
 from ytmusicapi import YTMusic
 
 from classes import Playlist, Song, MusicApi
@@ -60,11 +63,16 @@ class YTMusicApiConverter:
         if song_id is None or name is None:
             return None
 
-        return Song(song_id, name, authors, duration, album)
+        return Song(song_id, name, authors, duration, album, "YTMusic")
 
     @staticmethod
-    def playlist_from_json(json_dict: dict) -> Playlist | None:
-        """Attempts to parse a playlist from yt music json"""
+    def playlist_from_json(
+        json_dict: dict, loader: Callable[[str, str], list[Song]] | None = None
+    ) -> Playlist | None:
+        """
+        Attempts to parse a playlist from yt music json.
+        loader(id, name) is used to lazily fetch its songs
+        """
 
         pl_id = json_dict.get("playlistId")
         name = YTMusicApiConverter.get_title(json_dict)
@@ -75,7 +83,9 @@ class YTMusicApiConverter:
         if pl_id is None or name is None:
             return None
 
-        return Playlist(pl_id, name, authors)
+        if loader is None:
+            return Playlist(pl_id, name, authors)
+        return Playlist(pl_id, name, authors, partial(loader, pl_id, name))
 
 
 class YTMusicApi(MusicApi):
@@ -91,13 +101,20 @@ class YTMusicApi(MusicApi):
     def name(self) -> str:
         return "YTMusic"
 
-    def get_user_playlists(self) -> list[Playlist]:
-        """Gets user playlists (with songs)"""
-        playlists = self.get_client().get_library_playlists()
+    def get_user_playlists(
+        self, prefetch: bool = False, workers: int = 8
+    ) -> list[Playlist]:
+        """
+        Gets user playlists. Songs are fetched lazily on first access,
+        or all at once (concurrently) if prefetch is set
+        """
+        playlists = self._call(self.get_client().get_library_playlists)
 
         parsed: list[Playlist] = []
         for p_json in playlists:
-            plist = YTMusicApiConverter.playlist_from_json(p_json)
+            plist = YTMusicApiConverter.playlist_from_json(
+                p_json, self.get_playlist_songs
+            )
 
             if plist is None:
                 logger.log_warning(f"Skipping playlist: {p_json.get('title')}")
@@ -108,29 +125,41 @@ class YTMusicApi(MusicApi):
                 logger.log_message(f"Skipping playlist: {plist.name}")
                 continue
 
-            songs = self.get_client().get_playlist(plist.id, None, suggestions_limit=0).get("tracks")  # type: ignore
+            parsed.append(plist)
 
-            if songs is None:
-                songs = []
+        if prefetch:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(lambda p: p.load(), parsed))
 
-            for s_json in songs:
-                song = YTMusicApiConverter.song_from_json(s_json)
+        return parsed
 
-                if song is None:
-                    logger.log_warning(
-                        f"Skipping song '{s_json.get('title')}' in playlist: {plist.name}"
-                    )
-                    continue
+    def get_playlist_songs(self, pl_id: str, pl_name: str) -> list[Song]:
+        """Returns songs of a playlist"""
+        playlist = self._call(
+            self.get_client().get_playlist, pl_id, None, suggestions_limit=0
+        )
+        songs = playlist.get("tracks")  # type: ignore
 
-                plist.add_song(song)
+        if songs is None:
+            songs = []
 
-            parsed.append(plist)
+        parsed: list[Song] = []
+        for s_json in songs:
+            song = YTMusicApiConverter.song_from_json(s_json)
+
+            if song is None:
+                logger.log_warning(
+                    f"Skipping song '{s_json.get('title')}' in playlist: {pl_name}"
+                )
+                continue
+
+            parsed.append(song)
 
         return parsed
 
     def get_library_songs(self) -> list[Song]:
         """Returns songs saved in library"""
-        songs = self.get_client().get_library_songs(None, False)  # type: ignore
+        songs = self._call(self.get_client().get_library_songs, None, False)  # type: ignore
 
         parsed: list[Song] = []
         for s_json in songs:
@@ -143,7 +172,7 @@ class YTMusicApi(MusicApi):
 
     def get_liked_songs(self) -> list[Song]:
         """Returns liked songs"""
-        songs = self.get_client().get_liked_songs(None).get("tracks")  # type: ignore
+        songs = self._call(self.get_client().get_liked_songs, None).get("tracks")  # type: ignore
 
         if songs is None:
             raise YTMusicApiException()
@@ -159,7 +188,7 @@ class YTMusicApi(MusicApi):
 
     def get_history_songs(self) -> list[Song]:
         """Returns recently playes songs"""
-        songs = self.get_client().get_history()
+        songs = self._call(self.get_client().get_history)
 
         if songs is None:
             raise YTMusicApiException()
@@ -181,7 +210,7 @@ class YTMusicApi(MusicApi):
         """Search for a song based on name"""
         songs: set[Song] = set()
 
-        result = self.get_client().search(song.name, scope="songs")
+        result = self._call(self.get_client().search, song.name, scope="songs")
         for entry in result:
             parsed = YTMusicApiConverter.song_from_json(entry)
             if parsed is not None:
@@ -194,5 +223,5 @@ class YTMusicApi(MusicApi):
         return list(songs)
 
     def search_song_id(self, song_id: str) -> Song | None:
-        result = self.get_client().get_song(videoId=song_id)
+        result = self._call(self.get_client().get_song, videoId=song_id)
         return YTMusicApiConverter.song_from_json(result)
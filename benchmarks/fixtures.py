@@ -0,0 +1,194 @@
+import json
+import random
+import threading
+import time
+
+from api.cached import search_query
+from classes import Song, MusicApi
+from classes.playlist import Playlist
+from utils import filemanager
+
+
+class Fixture:
+    """
+    Recorded search responses for a playlist, replayable without network.
+    expected maps source ids to the right target id (None if it has no match),
+    it is only known for synthetic fixtures
+    """
+
+    _songs: list[Song]
+    _searches: dict[str, list[dict]]
+    _expected: dict[str, str | None]
+
+    def __init__(
+        self,
+        songs: list[Song] | None = None,
+        searches: dict[str, list[dict]] | None = None,
+        expected: dict[str, str | None] | None = None,
+    ) -> None:
+        self._songs = songs if songs is not None else []
+        self._searches = searches if searches is not None else {}
+        self._expected = expected if expected is not None else {}
+
+    @property
+    def songs(self) -> list[Song]:
+        """Returns the source playlist"""
+        return self._songs
+
+    @property
+    def searches(self) -> dict[str, list[dict]]:
+        """Returns recorded responses by search query"""
+        return self._searches
+
+    @property
+    def expected(self) -> dict[str, str | None]:
+        """Returns the right target id of every source song, if known"""
+        return self._expected
+
+    def add_search(self, song: Song, results: list[Song]) -> None:
+        """Records the response to a search"""
+        self._searches[search_query(song)] = [s.to_dict() for s in results]
+
+    def to_dict(self) -> dict:
+        """Returns a json-serializable representation"""
+        return {
+            "songs": [s.to_dict() for s in self._songs],
+            "searches": self._searches,
+            "expected": self._expected,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "Fixture":
+        """Creates a fixture from its dict representation"""
+        return Fixture(
+            [Song.from_dict(s) for s in data["songs"]],
+            dict(data.get("searches", {})),
+            dict(data.get("expected", {})),
+        )
+
+    def save(self, path: str) -> None:
+        """Writes fixture to a json file"""
+        filemanager.create_json_file(path, self.to_dict())
+
+    @staticmethod
+    def load(path: str) -> "Fixture":
+        """Reads fixture from a json file"""
+        with open(path, "r", encoding="utf-8") as file:
+            return Fixture.from_dict(json.load(file))
+
+
+class ReplayMusicApi(MusicApi):
+    """
+    Answers searches from a fixture, sleeping latency (+ up to jitter) seconds
+    per call to stand in for the network. Unknown queries find nothing
+    """
+
+    # the limiter is still in the path, but must never be what is measured
+    _rate: float = 1_000_000.0
+    _max_rate: float = 1_000_000.0
+
+    _fixture: Fixture
+    _latency: float
+    _jitter: float
+    _random: random.Random
+    _lock: threading.Lock
+    _calls: int
+    _unknown: int
+
+    def __init__(
+        self, fixture: Fixture, latency: float = 0.0, jitter: float = 0.0, seed: int = 0
+    ) -> None:
+        super().__init__()
+        self._fixture = fixture
+        self._latency = latency
+        self._jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._unknown = 0
+
+    @property
+    def name(self) -> str:
+        return "Replay"
+
+    @property
+    def calls(self) -> int:
+        """Returns amount of searches made"""
+        return self._calls
+
+    @property
+    def unknown(self) -> int:
+        """Returns amount of searches the fixture had no response for"""
+        return self._unknown
+
+    def reset(self) -> None:
+        """Zeroes call counters"""
+        with self._lock:
+            self._calls = 0
+            self._unknown = 0
+
+    def search_song(self, song: Song) -> list[Song]:
+        """Replays the recorded response to this search"""
+        return self._call(self.search, search_query(song))
+
+    def search(self, query: str) -> list[Song]:
+        """Sleeps like a request would and returns fresh songs, as parsing would"""
+        with self._lock:
+            self._calls += 1
+            delay = self._latency + self._random.uniform(0, self._jitter)
+            results = self._fixture.searches.get(query)
+            if results is None:
+                self._unknown += 1
+        if delay > 0:
+            time.sleep(delay)
+        return [Song.from_dict(s) for s in results or []]
+
+    def search_song_id(self, song_id: str) -> Song | None:
+        """Finds a track among every recorded response"""
+        for results in self._fixture.searches.values():
+            for s in results:
+                if s["id"] == song_id:
+                    return Song.from_dict(s)
+        return None
+
+    def get_user_playlists(self) -> list[Playlist]:
+        """Returns the fixture playlist"""
+        return [Playlist("fixture", "Fixture", [], lambda: self._fixture.songs)]
+
+
+class RecordingMusicApi(MusicApi):
+    """Wraps a real music api and records every search into a fixture"""
+
+    _api: MusicApi
+    _fixture: Fixture
+    _lock: threading.Lock
+
+    def __init__(self, api: MusicApi, fixture: Fixture | None = None) -> None:
+        super().__init__()
+        self._api = api
+        self._fixture = fixture if fixture is not None else Fixture()
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self._api.name
+
+    @property
+    def fixture(self) -> Fixture:
+        """Returns everything recorded so far"""
+        return self._fixture
+
+    def search_song(self, song: Song) -> list[Song]:
+        """Searches the wrapped api and records the response"""
+        results = self._api.search_song(song)
+        with self._lock:
+            self._fixture.add_search(song, results)
+        return results
+
+    def search_song_id(self, song_id: str) -> Song | None:
+        """Not recorded, fixtures only replay searches"""
+        return self._api.search_song_id(song_id)
+
+    def get_user_playlists(self) -> list[Playlist]:
+        """Not recorded, the source playlist is stored separately"""
+        return self._api.get_user_playlists()
@@ -0,0 +1,94 @@
+"""
+Checks NameScorer against the plain difflib check on a golden set of
+title pairs and times both.
+
+    python -m benchmarks.fuzzy
+"""
+
+import difflib
+import random
+import time
+
+from utils import fuzzy
+
+TITLES = [
+    "Bohemian Rhapsody",
+    "Bohemian Rhapsody (Remastered 2011)",
+    "Don't Stop Me Now",
+    "Don't Stop Me Now (Live)",
+    "Smells Like Teen Spirit",
+    "Blinding Lights",
+    "Blinding Lights (Chromatics Remix)",
+    "Levitating (feat. DaBaby)",
+    "Levitating",
+    "Café del Mar",
+    "Cafe Del Mar (Energy 52 Remix)",
+    "Nothing Else Matters",
+    "Everything Now",
+    "Heroes",
+    "Héroes",
+    "Hey Jude",
+    "Hey Jude - Remastered 2015",
+    "Strobe",
+    "Midnight City",
+    "Mr. Brightside",
+]
+
+
+def mutate(rng: random.Random, title: str) -> str:
+    """Returns a slightly changed title, like search results tend to be"""
+    choice = rng.randint(0, 4)
+    if choice == 0:
+        return title.lower()
+    if choice == 1 and len(title) > 3:
+        index = rng.randrange(len(title))
+        return title[:index] + title[index + 1 :]
+    if choice == 2:
+        return title + rng.choice([" (Live)", " - Single", " (Remix)", "!"])
+    if choice == 3:
+        return rng.choice(TITLES)
+    return title
+
+
+def golden_pairs(amount: int = 20_000, seed: int = 42) -> list[tuple[str, str]]:
+    """Returns a reproducible set of title pairs"""
+    rng = random.Random(seed)
+    pairs: list[tuple[str, str]] = []
+    for _ in range(amount):
+        left = rng.choice(TITLES)
+        pairs.append((left, mutate(rng, left)))
+    return pairs
+
+
+def reference(left: str, right: str) -> bool:
+    """The original check from similarity.have_similar_names"""
+    return difflib.SequenceMatcher(None, left, right).ratio() > 0.8
+
+
+def main() -> None:
+    """Runs the golden check and the benchmark"""
+    pairs = golden_pairs()
+
+    start = time.perf_counter()
+    expected = [reference(left, right) for (left, right) in pairs]
+    baseline = time.perf_counter() - start
+    print(f"difflib reference: {baseline:.3f}s for {len(pairs)} pairs")
+
+    backends = ["difflib"] + (["rapidfuzz"] if fuzzy.Indel is not None else [])
+    for backend in backends:
+        scorer = fuzzy.NameScorer(0.8, backend)
+        start = time.perf_counter()
+        actual = [scorer.is_similar(left, right) for (left, right) in pairs]
+        elapsed = time.perf_counter() - start
+
+        mismatches = sum(1 for (e, a) in zip(expected, actual) if e != a)
+        print(
+            f"NameScorer({backend}): {elapsed:.3f}s "
+            + f"(x{baseline / elapsed:.1f}), mismatches: {mismatches}"
+        )
+        if mismatches > 0:
+            raise SystemExit(f"{backend} backend disagrees with difflib")
+
+
+if __name__ == "__main__":
+    main()
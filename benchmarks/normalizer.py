@@ -0,0 +1,130 @@
+"""
+Checks possibility.format_song against the original replace/regex chain
+on a golden set of noisy titles and times both.
+
+    python -m benchmarks.normalizer
+"""
+
+import random
+import re
+import time
+
+from classes import Song
+from utils import possibility
+from utils.normalizer import TitleNormalizer
+from .fuzzy import TITLES
+from .synthetic import ARTISTS
+
+NOISE = [
+    "",
+    " (Lyrics)",
+    " (Official Video)",
+    " (Visualization)",
+    " (Music Visualization)",
+    " (Live)",
+    " (feat. Daft Punk)",
+    " (ft. Sade & Air)",
+    " (featuring Björk)",
+    " (feat. M83) (Official Video)",
+    " (Remastered 2011) (Lyrics)",
+]
+
+
+def reference_name(song: Song) -> Song:
+    """The original possibility.format_song_name"""
+    name = song.name
+    delete = [
+        " (Lyrics)",
+        " (Official Video)",
+        " (Visualization)",
+        " (Music Visualization)",
+    ]
+    for d in delete:
+        name = name.replace(d, "")
+    video_format_regex = r"(.*?)\s+-\s+(.+)"
+    match = re.search(video_format_regex, name)
+    if match:
+        name = match.groups()[1]
+    return song.with_name(name)
+
+
+def reference_authors(song: Song) -> Song:
+    """The original possibility.format_song_authors"""
+    new_authors: set[str] = set()
+    feat_regex = r"\s*(?:\((?:ft|featuring|feat)\.?\s*(.*)\))"
+    match = re.search(feat_regex, song.name)
+    if match:
+        new_authors.add(match.groups()[0])
+    video_format_regex = r"(.*?)\s+-\s+(.+)"
+    match = re.search(video_format_regex, song.name)
+    if match:
+        new_authors.add(match.groups()[0])
+    for author in set(song.authors):
+        if " & " in author:
+            new_authors.update(author.split(" & "))
+        if " / " in author:
+            new_authors.update(author.split(" / "))
+    new_authors_list = list(new_authors)
+    new_authors_list[0:0] = song.authors
+    return song.with_authors(new_authors_list)
+
+
+def golden_songs(distinct: int = 2_000, amount: int = 100_000, seed: int = 42):
+    """
+    Returns a reproducible list of songs where titles repeat,
+    like candidates coming back from query after query
+    """
+    rng = random.Random(seed)
+    pool: list[Song] = []
+    for index in range(distinct):
+        title = rng.choice(TITLES) + rng.choice(NOISE)
+        if rng.random() < 0.2:
+            title = f"{rng.choice(ARTISTS)} - {title}"
+        authors = [rng.choice(ARTISTS)]
+        if rng.random() < 0.2:
+            authors = [f"{authors[0]} & {rng.choice(ARTISTS)}"]
+        elif rng.random() < 0.1:
+            authors = [f"{authors[0]} / {rng.choice(ARTISTS)}"]
+        pool.append(Song(str(index), title, authors, 200))
+    return [rng.choice(pool) for _ in range(amount)]
+
+
+def same(left: Song, right: Song, authors: int) -> bool:
+    """Compares formatted songs; authors added from titles come in set order"""
+    return (
+        left.name == right.name
+        and left.authors[:authors] == right.authors[:authors]
+        and set(left.authors[authors:]) == set(right.authors[authors:])
+    )
+
+
+def main() -> None:
+    """Runs the golden check and the benchmark"""
+    songs = golden_songs()
+
+    start = time.perf_counter()
+    expected = [reference_authors(reference_name(s)) for s in songs]
+    baseline = time.perf_counter() - start
+    print(f"replace/regex reference: {baseline:.3f}s for {len(songs)} songs")
+
+    # a fresh normalizer, so its caches start cold
+    possibility.NORMALIZER = TitleNormalizer(possibility.NORMALIZER.noise)
+    start = time.perf_counter()
+    actual = [possibility.format_song(s) for s in songs]
+    elapsed = time.perf_counter() - start
+
+    mismatches = sum(
+        1
+        for (song, e, a) in zip(songs, expected, actual)
+        if not same(e, a, len(song.authors))
+    )
+    print(
+        f"TitleNormalizer: {elapsed:.3f}s (x{baseline / elapsed:.1f}), "
+        + f"mismatches: {mismatches}"
+    )
+    if mismatches > 0:
+        raise SystemExit("TitleNormalizer disagrees with the original code")
+
+
+if __name__ == "__main__":
+    main()
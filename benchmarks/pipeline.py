@@ -0,0 +1,218 @@
+"""
+Runs the async matcher over replayed search responses, without network,
+and reports throughput, per-song latency, api calls per song,
+peak memory and match rate for every playlist size.
+
+    python -m benchmarks.pipeline
+    python -m benchmarks.pipeline --sizes 1000 --latency 0.05 --jitter 0.05
+    python -m benchmarks.pipeline --fixture recorded.json
+
+Fixtures are recorded from real apis with 'python -m benchmarks.record'
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+import tracemalloc
+
+from api.mapper import find_song_async, find_songs_parallel
+from classes import Song
+from utils.planner import QueryPlanner
+from utils.similarity import MatchResult
+from utils.singleflight import FLIGHTS
+from .fixtures import Fixture, ReplayMusicApi
+from .synthetic import make_fixture
+
+
+class Run:
+    """Measurements of one pass over a playlist"""
+
+    _results: list[MatchResult]
+    _latencies: list[float]
+    _elapsed: float
+    _calls: int
+    _coalesced: int
+
+    def __init__(
+        self,
+        results: list[MatchResult],
+        latencies: list[float],
+        elapsed: float,
+        calls: int,
+        coalesced: int = 0,
+    ) -> None:
+        self._results = results
+        self._latencies = sorted(latencies)
+        self._elapsed = elapsed
+        self._calls = calls
+        self._coalesced = coalesced
+
+    @property
+    def results(self) -> list[MatchResult]:
+        """Returns every match result"""
+        return self._results
+
+    @property
+    def throughput(self) -> float:
+        """Returns songs matched per second"""
+        return len(self._results) / self._elapsed if self._elapsed > 0 else 0.0
+
+    @property
+    def calls_per_song(self) -> float:
+        """Returns searches made per song"""
+        return self._calls / len(self._results) if len(self._results) > 0 else 0.0
+
+    @property
+    def coalesced(self) -> int:
+        """Returns searches answered by an identical one already in flight"""
+        return self._coalesced
+
+    def percentile(self, q: float) -> float:
+        """Returns the q-th percentile of per-song latency in seconds"""
+        if len(self._latencies) == 0:
+            return 0.0
+        return self._latencies[round(q * (len(self._latencies) - 1))]
+
+
+async def match_all(
+    songs: list[Song],
+    api: ReplayMusicApi,
+    concurrency: int,
+    variants: int,
+    planner: QueryPlanner | None,
+) -> tuple[list[MatchResult], list[float]]:
+    """
+    Matches songs the way find_songs_stream does (4 * concurrency songs at once),
+    timing each song from its start to its result
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    window = asyncio.Semaphore(4 * concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def timed(index: int, song: Song) -> tuple[MatchResult, float]:
+        async with window:
+            start = time.perf_counter()
+            result = await find_song_async(
+                song, index, api, semaphore, executor, variants, planner
+            )
+            return result, time.perf_counter() - start
+
+    try:
+        timings = await asyncio.gather(
+            *(timed(index + 1, song) for (index, song) in enumerate(songs))
+        )
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return [r for (r, _) in timings], [t for (_, t) in timings]
+
+
+def match_in_processes(
+    songs: list[Song],
+    api: ReplayMusicApi,
+    concurrency: int,
+    processes: int,
+    planner: QueryPlanner | None,
+) -> tuple[list[MatchResult], list[float]]:
+    """Matches songs with find_songs_parallel, which works in rounds, not per song"""
+    results: list[MatchResult] = []
+    find_songs_parallel(songs, api, processes, concurrency, 32, results.append, planner)
+    return results, []
+
+
+def run(
+    fixture: Fixture,
+    api: ReplayMusicApi,
+    concurrency: int,
+    variants: int,
+    use_planner: bool,
+    processes: int = 0,
+) -> Run:
+    """Matches every fixture song once, with matcher logs silenced"""
+    api.reset()
+    FLIGHTS.reset()
+    planner = QueryPlanner(None) if use_planner else None
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            if processes > 0:
+                results, latencies = match_in_processes(
+                    fixture.songs, api, concurrency, processes, planner
+                )
+            else:
+                results, latencies = asyncio.run(
+                    match_all(fixture.songs, api, concurrency, variants, planner)
+                )
+            elapsed = time.perf_counter() - start
+    return Run(results, latencies, elapsed, api.calls, FLIGHTS.saved)
+
+
+def match_rate(fixture: Fixture, results: list[MatchResult]) -> str:
+    """Returns share of identical matches, and of right ones if they are known"""
+    identical = [r for r in results if r.tier == "identical"]
+    report = f"identical {len(identical) / len(results):.1%}"
+    if len(fixture.expected) == 0:
+        return report
+
+    right = sum(
+        1 for r in identical if fixture.expected.get(r.source.id) == r.target_id
+    )
+    wrong = len(identical) - right
+    findable = sum(1 for target in fixture.expected.values() if target is not None)
+    return report + f" (right {right}/{findable}, wrong {wrong})"
+
+
+def main() -> None:
+    """Runs the benchmark for every size"""
+    parser = argparse.ArgumentParser(description="Offline matcher benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--fixture", help="replay a recorded fixture instead")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--variants", type=int, default=1)
+    parser.add_argument("--planner", action="store_true", help="use a query planner")
+    parser.add_argument(
+        "--processes", type=int, default=0, help="score in worker processes"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.fixture is not None:
+        fixtures = [(args.fixture, Fixture.load(args.fixture))]
+    else:
+        fixtures = [(str(size), make_fixture(size, args.seed)) for size in args.sizes]
+
+    for label, fixture in fixtures:
+        api = ReplayMusicApi(fixture, args.latency, args.jitter, args.seed)
+        options = (args.concurrency, args.variants, args.planner, args.processes)
+        timed = run(fixture, api, *options)
+
+        # tracemalloc slows everything down, so memory gets a pass of its own
+        # (worker processes are not traced)
+        tracemalloc.start()
+        run(fixture, api, *options)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latency = (
+            f"p50 {timed.percentile(0.5) * 1000:.1f}ms "
+            + f"p99 {timed.percentile(0.99) * 1000:.1f}ms"
+            if args.processes == 0
+            else "no per-song latency in rounds"
+        )
+        print(
+            f"{label}: {len(fixture.songs)} songs, {timed.throughput:.0f} songs/s "
+            + f"| {latency} "
+            + f"| {timed.calls_per_song:.2f} calls/song ({timed.coalesced} coalesced) "
+            + f"| peak {peak / 2**20:.1f}MB "
+            + f"| {match_rate(fixture, timed.results)}"
+        )
+        if api.unknown > 0:
+            print(f"{label}: {api.unknown} searches were not in the fixture")
+
+
+if __name__ == "__main__":
+    main()
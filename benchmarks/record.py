@@ -0,0 +1,37 @@
+"""
+Matches a yt music playlist against deezer once, recording every search,
+so 'python -m benchmarks.pipeline --fixture <path>' can replay it offline.
+
+    python -m benchmarks.record "All Them Moods" fixture.json
+"""
+
+import argparse
+
+from api import YTMusicApi, DeezerApi, find_songs_sync
+from utils import logger
+from .fixtures import Fixture, RecordingMusicApi
+
+
+def main() -> None:
+    """Records a fixture"""
+    parser = argparse.ArgumentParser(description="Record a benchmark fixture")
+    parser.add_argument("playlist", help="name of the playlist")
+    parser.add_argument("path", help="where to write the fixture")
+    args = parser.parse_args()
+
+    playlists = YTMusicApi("oauth.json").get_user_playlists()
+    chosen_playlist = next((p for p in playlists if p.name == args.playlist), None)
+    if chosen_playlist is None:
+        logger.log_error(f"Can't find playlist with name: {args.playlist}")
+        return
+
+    recorder = RecordingMusicApi(DeezerApi(), Fixture(chosen_playlist.songs))
+    find_songs_sync(chosen_playlist.songs, recorder)
+    recorder.fixture.save(args.path)
+    logger.log_success(
+        f"Recorded {len(recorder.fixture.searches)} searches to {args.path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
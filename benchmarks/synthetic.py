@@ -0,0 +1,152 @@
+"""
+Builds reproducible fixtures of any size out of made up songs.
+Source titles get the noise real playlists have (feat. tags, video suffixes,
+'Artist - Title' uploads, slightly off durations) and each search returns
+the right track, if it exists, among decoys like live versions and remixes
+"""
+
+import random
+
+from classes import Song
+from utils import possibility
+from .fixtures import Fixture
+
+WORDS = [
+    "love",
+    "night",
+    "city",
+    "light",
+    "dream",
+    "fire",
+    "heart",
+    "summer",
+    "midnight",
+    "river",
+    "golden",
+    "wild",
+    "electric",
+    "blue",
+    "home",
+    "ghost",
+    "echo",
+    "shadow",
+    "paradise",
+    "velvet",
+    "neon",
+    "ocean",
+    "silver",
+    "storm",
+]
+
+ARTISTS = [
+    "The Midnight",
+    "Daft Punk",
+    "Tame Impala",
+    "Beyoncé",
+    "Röyksopp",
+    "M83",
+    "Khruangbin",
+    "Björk",
+    "Disclosure",
+    "Little Dragon",
+    "Caribou",
+    "Bonobo",
+    "Four Tet",
+    "Sade",
+    "Air",
+    "Moderat",
+]
+
+
+def make_fixture(size: int, seed: int = 42, decoys: int = 4) -> Fixture:
+    """Returns a fixture with a playlist of 'size' songs"""
+    rng = random.Random(seed)
+    fixture = Fixture()
+    used: set[tuple[str, str]] = set()
+
+    for index in range(size):
+        # a (title, artist) pair is a search query, so it must be unique
+        title, artist = "", ""
+        while title == "" or (title, artist) in used:
+            title = " ".join(rng.sample(WORDS, rng.randint(1, 3))).title()
+            artist = rng.choice(ARTISTS)
+        used.add((title, artist))
+        featured = rng.choice(ARTISTS) if rng.random() < 0.2 else None
+        duration = rng.randint(120, 360)
+
+        exists = rng.random() < 0.9
+        target_name = title if featured is None else f"{title} (feat. {featured})"
+        target = Song(f"t{index}", target_name, [artist], duration, provider="Replay")
+
+        source = Song(
+            f"s{index}",
+            noisy_title(rng, title, artist, featured),
+            [artist],
+            None if rng.random() < 0.05 else duration + rng.randint(-1, 1),
+            provider="YTMusic",
+        )
+        fixture.songs.append(source)
+        fixture.expected[source.id] = target.id if exists else None
+
+        formatted = possibility.format_song(source)
+        variants = possibility.get_possible_variants(formatted)
+        for kind, name in variants:
+            results = make_decoys(rng, index, title, artist, duration, decoys)
+            # bracketed queries only find the track some of the time, like real search
+            bracketed = kind == "original" and len(variants) > 1
+            if exists and (not bracketed or rng.random() < 0.5):
+                results.insert(rng.randint(0, len(results)), target)
+            fixture.add_search(formatted.with_name(name), results)
+
+    return fixture
+
+
+def noisy_title(
+    rng: random.Random, title: str, artist: str, featured: str | None
+) -> str:
+    """Returns title the way a video upload might name it"""
+    if featured is not None:
+        title = f"{title} (feat. {featured})"
+    roll = rng.random()
+    if roll < 0.1:
+        return f"{title} (Official Video)"
+    if roll < 0.2:
+        return f"{artist} - {title}"
+    if roll < 0.25:
+        return f"{title} ({rng.choice(['Remastered', 'Radio Edit', 'Extended Mix'])})"
+    if roll < 0.3:
+        return title.upper()
+    return title
+
+
+def make_decoys(
+    rng: random.Random,
+    index: int,
+    title: str,
+    artist: str,
+    duration: int,
+    amount: int,
+) -> list[Song]:
+    """Returns tracks a search for the song would also find"""
+    decoys: list[Song] = []
+    for decoy in range(amount):
+        roll = rng.random()
+        if roll < 0.3:
+            name, authors = f"{title} (Live)", [artist]
+        elif roll < 0.5:
+            name, authors = f"{title} (Remix)", [rng.choice(ARTISTS)]
+        elif roll < 0.7:
+            name, authors = title, [rng.choice(ARTISTS)]
+        else:
+            name = " ".join(rng.sample(WORDS, rng.randint(1, 3))).title()
+            authors = [artist]
+        decoys.append(
+            Song(
+                f"d{index}_{decoy}",
+                name,
+                authors,
+                duration + rng.randint(10, 90),
+                provider="Replay",
+            )
+        )
+    return decoys
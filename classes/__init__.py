@@ -1,4 +1,4 @@
 from .item import Item
-from .song import Song
+from .song import Song, NormalizedSong
 from .playlist import Playlist
 from .musicapi import MusicApi
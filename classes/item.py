@@ -1,9 +1,11 @@
 class Item:
     """A base class for songs/playlists"""
 
-    _id: str = ""
-    _name: str = ""
-    _authors: list[str] = []
+    __slots__ = ("_id", "_name", "_authors")
+
+    _id: str
+    _name: str
+    _authors: list[str]
 
     def __init__(self, item_id: str, name: str, authors: list[str]) -> None:
         self._id = item_id
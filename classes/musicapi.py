@@ -1,17 +1,58 @@
 from abc import ABC, abstractmethod
+from typing import Any, Callable, TypeVar
 
+from utils import ratelimit
+from utils.metrics import METRICS
+from utils.singleflight import FLIGHTS, flight_key
 from .song import Song
 from .playlist import Playlist
 
+T = TypeVar("T")
+
 
 class MusicApi(ABC):
     """An abstract base class for any music api"""
 
+    _rate: float = 5.0
+    _max_rate: float = 20.0
+
     @property
     def name(self) -> str:
         """Retunrs the name of the api"""
         raise NotImplementedError("Property 'name' is not implemented")
 
+    @property
+    def limiter(self) -> ratelimit.RateLimiter:
+        """Returns the rate limiter shared by every client of this api"""
+        return ratelimit.get_limiter(self.name, self._rate, self._max_rate)
+
+    def _call(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Routes a client request through the shared rate limiter.
+        Identical requests (same function and arguments) made while one is
+        in flight wait for it and share its result instead of using up quota,
+        so func must only depend on its arguments
+        """
+        method = getattr(func, "__name__", type(func).__name__)
+        key = flight_key(self, func, args, kwargs)
+        if key is None:
+            return self._limited_call(method, func, *args, **kwargs)
+        labels = {"provider": self.name, "method": method}
+        return FLIGHTS.do(
+            key, self._limited_call, method, func, *args, labels=labels, **kwargs
+        )
+
+    def _limited_call(
+        self, method: str, func: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        """Makes a client request under the shared rate limiter"""
+        try:
+            with METRICS.timer("api_call_seconds", provider=self.name, method=method):
+                return self.limiter.call(func, *args, **kwargs)
+        except Exception:
+            METRICS.inc("api_errors_total", provider=self.name, method=method)
+            raise
+
     @abstractmethod
     def search_song(self, song: Song) -> list[Song]:
         """Searches using songs name/author/other attributes"""
@@ -22,6 +63,18 @@ class MusicApi(ABC):
         """Finds a track using its id"""
         raise NotImplementedError("Method 'search_song_id' is not implemented")
 
+    def search_song_isrc(self, isrc: str) -> Song | None:
+        """Finds a track by its ISRC, None if missing or not supported by the api"""
+        return None
+
+    def search_album_songs(self, album: str, artist: str) -> list[Song]:
+        """Returns tracklist of an album, empty if missing or not supported by the api"""
+        return []
+
+    def search_artist_songs(self, artist: str) -> list[Song]:
+        """Returns top and album tracks of an artist, empty if not supported by the api"""
+        return []
+
     @abstractmethod
     def get_user_playlists(self) -> list[Playlist]:
         """Returns user playlists"""
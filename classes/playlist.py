@@ -1,23 +1,61 @@
+from typing import Callable
+import threading
+
 from classes import Item, Song
 from utils import assert_parameter
 
 
 class Playlist(Item):
-    """A class to represent yt music playlists"""
+    """
+    A class to represent yt music playlists.
+    If a loader is given, songs are fetched with it on first access
+    """
 
     _songs: dict[str, list[Song]] = {}
+    _loader: Callable[[], list[Song]] | None = None
+    _load_lock: threading.Lock
 
-    def __init__(self, pl_id: str, name: str, authors: list[str]) -> None:
+    def __init__(
+        self,
+        pl_id: str,
+        name: str,
+        authors: list[str],
+        loader: Callable[[], list[Song]] | None = None,
+    ) -> None:
         super().__init__(pl_id, name, authors)
         self._songs = {}
+        self._loader = loader
+        self._load_lock = threading.Lock()
 
     @property
     def songs(self) -> list[Song]:
-        """Returns list of songs"""
+        """Returns list of songs, loading them first if needed"""
+        self.load()
         return [item for row in self._songs.values() for item in row]
 
+    @property
+    def loaded(self) -> bool:
+        """Returns False while songs are still to be fetched"""
+        return self._loader is None
+
+    def load(self) -> None:
+        """Fetches songs using the loader, only once"""
+        if self._loader is None:
+            return
+        with self._load_lock:
+            if self._loader is None:
+                return
+            songs = self._loader()
+            for s in songs:
+                self._add_song(s)
+            self._loader = None
+
     def add_song(self, song: Song, duplicate: bool = False) -> bool:
         """Adds a song to playlist"""
+        self.load()
+        return self._add_song(song, duplicate)
+
+    def _add_song(self, song: Song, duplicate: bool = False) -> bool:
         assert_parameter(song, Song, "song")
 
         if self._songs.get(song.id) is None:
@@ -40,7 +78,8 @@ class Playlist(Item):
         return f"PLAYLIST - '{self.name}' by {' & '.join(self.authors)}"
 
     def __str__(self) -> str:
+        songs = len(self.songs) if self.loaded else "not loaded"
         return (
             f"PLAYLIST (id: {self.id} | name: {self.name} "
-            + f"| authors: {self.authors} | songs: {len(self.songs)})"
+            + f"| authors: {self.authors} | songs: {songs})"
         )
@@ -1,46 +1,193 @@
+from typing import Iterable
+import sys
+
 from classes import Item
-from utils import assert_parameter
+from utils import slugify_cached
+
+
+def _intern(value):
+    """Interns strings, leaves anything else (e.g. None) as is"""
+    return sys.intern(value) if type(value) is str else value
+
+
+class NormalizedSong:
+    """Compact slugified form of a song, used when comparing songs"""
+
+    __slots__ = ("_name", "_authors", "_album", "_duration")
+
+    _name: str
+    _authors: frozenset[str]
+    _album: str
+    _duration: int | None
+
+    def __init__(
+        self, name: str, authors: frozenset[str], album: str, duration: int | None
+    ) -> None:
+        self._name = name
+        self._authors = authors
+        self._album = album
+        self._duration = duration
+
+    @property
+    def name(self) -> str:
+        """Returns name used for comparison"""
+        return self._name
+
+    @property
+    def authors(self) -> frozenset[str]:
+        """Returns slugified authors"""
+        return self._authors
+
+    @property
+    def album(self) -> str:
+        """Returns slugified album"""
+        return self._album
+
+    @property
+    def duration(self) -> int | None:
+        """Returns duration"""
+        return self._duration
 
 
 class Song(Item):
-    """Represents a song"""
+    """
+    Represents a song. Songs are immutable and compare equal when they
+    come from the same provider and have the same id.
+    Authors and album strings are interned, since they repeat a lot
+    """
+
+    __slots__ = ("_duration", "_album", "_provider", "_isrc", "_normalized")
 
-    _duration: int | None = None
-    _album: str | None = None
+    _authors: tuple[str, ...]  # type: ignore
+    _duration: int | None
+    _album: str | None
+    _provider: str | None
+    _isrc: str | None
+    _normalized: NormalizedSong | None
 
     def __init__(
         self,
         song_id: str,
         name: str,
-        authors: list[str],
+        authors: Iterable[str],
         duration: int | None = None,
         album: str | None = None,
+        provider: str | None = None,
+        isrc: str | None = None,
     ) -> None:
-        super().__init__(song_id, name, authors)
-        if duration is not None:
-            self.duration = duration
-        if album is not None:
-            self.album = album
+        interned = tuple(_intern(a) for a in authors)
+        super().__init__(song_id, name, interned)  # type: ignore
+        self._duration = duration
+        self._album = _intern(album)
+        self._provider = provider
+        self._isrc = isrc
+        self._normalized = None
+
+    @property
+    def authors(self) -> tuple[str, ...]:  # type: ignore
+        """Returns song's authors"""
+        return self._authors
 
     @property
     def duration(self) -> int | None:
         """Returns song's duration"""
         return self._duration
 
-    @duration.setter
-    def duration(self, value: int) -> None:
-        assert_parameter(value, int, "duration")
-        self._duration = value
-
     @property
     def album(self) -> str | None:
         """Retunrs song's album"""
         return self._album
 
-    @album.setter
-    def album(self, value: str) -> None:
-        assert_parameter(value, str, "album")
-        self._album = value
+    @property
+    def provider(self) -> str | None:
+        """Returns name of the api the song comes from"""
+        return self._provider
+
+    @property
+    def isrc(self) -> str | None:
+        """Returns International Standard Recording Code, if known"""
+        return self._isrc
+
+    def with_name(self, name: str) -> "Song":
+        """Returns a copy with a different name"""
+        return Song(
+            self.id,
+            name,
+            self.authors,
+            self.duration,
+            self.album,
+            self.provider,
+            self.isrc,
+        )
+
+    def with_authors(self, authors: Iterable[str]) -> "Song":
+        """Returns a copy with different authors"""
+        return Song(
+            self.id,
+            self.name,
+            authors,
+            self.duration,
+            self.album,
+            self.provider,
+            self.isrc,
+        )
+
+    def with_isrc(self, isrc: str | None) -> "Song":
+        """Returns a copy with a different isrc"""
+        return Song(
+            self.id,
+            self.name,
+            self.authors,
+            self.duration,
+            self.album,
+            self.provider,
+            isrc,
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Song):
+            return NotImplemented
+        return self._id == other._id and self._provider == other._provider
+
+    def __hash__(self) -> int:
+        return hash((self._provider, self._id))
+
+    @property
+    def normalized(self) -> NormalizedSong:
+        """Returns normalized form, computed once per song"""
+        if self._normalized is None:
+            self._normalized = NormalizedSong(
+                self.name,
+                frozenset(slugify_cached(a) for a in self.authors),
+                slugify_cached(self.album),
+                self.duration,
+            )
+        return self._normalized
+
+    def to_dict(self) -> dict:
+        """Returns a json-serializable representation"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "authors": list(self.authors),
+            "duration": self.duration,
+            "album": self.album,
+            "provider": self.provider,
+            "isrc": self.isrc,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "Song":
+        """Creates a song from its dict representation"""
+        return Song(
+            data["id"],
+            data["name"],
+            list(data["authors"]),
+            data.get("duration"),
+            data.get("album"),
+            data.get("provider"),
+            data.get("isrc"),
+        )
 
     def pretty(self) -> str:
         """Returns a pretty print"""
@@ -51,4 +198,6 @@ class Song(Item):
         return base
 
     def __str__(self) -> str:
-        return f"SONG - id: {self.id} | name: {self.name} | authors: {self.authors}"
+        return (
+            f"SONG - id: {self.id} | name: {self.name} | authors: {list(self.authors)}"
+        )
@@ -1,17 +1,228 @@
-from api import YTMusicApi, DeezerApi, find_songs_async
-from utils import logger, filemanager
-from classes import MusicApi
+import argparse
+import asyncio
+import signal
+import threading
+
+from api import (
+    YTMusicApi,
+    DeezerApi,
+    CachedMusicApi,
+    find_songs_async,
+    find_songs_parallel,
+)
+from api.albums import find_songs_by_album
+from api.catalog import find_songs_by_artist
+from api.deezer import AddStatus, AddReport
+from api.favorites import FavoritesIndex, find_songs_in_favorites
+from api.mapper import select_best
+from api.pipeline import migrate_songs
+from utils import filemanager, logger, possibility
+from utils.batch import BatchScorer
+from utils.cache import SearchCache
+from utils.export import ExportRecord, ExportWriter, read_export
+from utils.isrc import IsrcMap
+from utils.journal import Journal
+from utils.library import Library
+from utils.metrics import METRICS
+from utils.planner import QueryPlanner
+from utils.similarity import MatchResult
+from utils.singleflight import FLIGHTS
+from utils.sync import SyncState, diff_playlist
+from classes import MusicApi, Song
+
+EXPORT_PATH = "export.jsonl"
+JOURNAL_PATH = "export.journal.jsonl"
+LIBRARY_PATH = "library.json"
+ISRC_MAP_PATH = "isrc_map.json"
+QUERY_STATS_PATH = "query_stats.json"
+METRICS_PATH = "metrics.json"
+SYNC_PATH = "sync.json"
+FAVORITES_PATH = "favorites.json"
 
 
 def main() -> None:
     """Main function"""
-    yt_music_api = YTMusicApi("oauth.json")
+    parser = argparse.ArgumentParser(description="Transfer a music library to deezer")
+    parser.add_argument(
+        "--metrics",
+        default=METRICS_PATH,
+        help="where to write a metrics snapshot (prometheus text if it ends in .prom)",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="match a yt music playlist")
+    convert.add_argument("playlist", help="name of the playlist")
+    convert.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip songs already resolved by an interrupted run",
+    )
+    convert.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        help="score candidates in this many worker processes (for cached re-runs)",
+    )
+    convert.add_argument(
+        "--albums",
+        action="store_true",
+        help="match songs sharing an album against its tracklist first",
+    )
+    convert.add_argument(
+        "--artists",
+        action="store_true",
+        help="prefetch catalogs of frequent artists and match their songs locally",
+    )
+
+    library = commands.add_parser(
+        "library", help="match every playlist, liked and library song at once"
+    )
+    library.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip songs already resolved by an interrupted run",
+    )
+    library.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        help="score candidates in this many worker processes (for cached re-runs)",
+    )
+    library.add_argument(
+        "--albums",
+        action="store_true",
+        help="match songs sharing an album against its tracklist first",
+    )
+    library.add_argument(
+        "--artists",
+        action="store_true",
+        help="prefetch catalogs of frequent artists and match their songs locally",
+    )
+
+    rescore = commands.add_parser(
+        "rescore", help="re-match a playlist offline against cached search results"
+    )
+    rescore.add_argument("playlist", help="name of the playlist")
+
+    add = commands.add_parser("add", help=f"add matches from {EXPORT_PATH} to deezer")
+    add.add_argument(
+        "--follow",
+        action="store_true",
+        help="add records of a conversion running alongside as they are written",
+    )
+
+    migrate = commands.add_parser(
+        "migrate", help="match a playlist and add matches to deezer at the same time"
+    )
+    migrate.add_argument("playlist", help="name of the playlist")
+
+    sync = commands.add_parser(
+        "sync",
+        help="match and add only songs changed since the playlist was last synced",
+    )
+    sync.add_argument("playlist", help="name of the playlist")
+
+    for command in (convert, library, migrate, sync):
+        command.add_argument(
+            "--favorites",
+            action="store_true",
+            help=f"skip songs already in deezer favorites (kept in {FAVORITES_PATH})",
+        )
+
+    args = parser.parse_args()
     deezer_api = DeezerApi()
-    # convert_playlist("All Them Moods", yt_music_api, deezer_api)
-    deezer_add("All Them Moods", deezer_api)
+    watch_metrics(args.metrics)
+
+    try:
+        run_command(args, deezer_api)
+    finally:
+        METRICS.dump(args.metrics)
+        logger.log_message(f"Metrics written to {args.metrics}")
+
+
+def run_command(args: argparse.Namespace, deezer_api: DeezerApi) -> None:
+    """Runs the chosen subcommand"""
+    if args.command == "add":
+        deezer_add(deezer_api, args.follow)
+        return
+
+    favorites = None
+    if getattr(args, "favorites", False):
+        favorites = FavoritesIndex(FAVORITES_PATH)
+        favorites.refresh(deezer_api)
+        favorites.save()
+
+    cache = SearchCache()
+    try:
+        if args.command == "convert":
+            yt_music_api = YTMusicApi("oauth.json")
+            cached_deezer_api = CachedMusicApi(deezer_api, cache)
+            convert_playlist(
+                args.playlist,
+                yt_music_api,
+                cached_deezer_api,
+                args.resume,
+                args.processes,
+                args.albums,
+                args.artists,
+                favorites,
+            )
+        elif args.command == "library":
+            yt_music_api = YTMusicApi("oauth.json")
+            cached_deezer_api = CachedMusicApi(deezer_api, cache)
+            convert_library(
+                yt_music_api,
+                cached_deezer_api,
+                args.resume,
+                args.processes,
+                args.albums,
+                args.artists,
+                favorites,
+            )
+        elif args.command == "rescore":
+            yt_music_api = YTMusicApi("oauth.json")
+            rescore_playlist(
+                args.playlist, yt_music_api, CachedMusicApi(deezer_api, cache)
+            )
+        elif args.command == "migrate":
+            yt_music_api = YTMusicApi("oauth.json")
+            cached_deezer_api = CachedMusicApi(deezer_api, cache)
+            migrate_playlist(
+                args.playlist, yt_music_api, cached_deezer_api, deezer_api, favorites
+            )
+        elif args.command == "sync":
+            yt_music_api = YTMusicApi("oauth.json")
+            cached_deezer_api = CachedMusicApi(deezer_api, cache)
+            sync_playlist(
+                args.playlist, yt_music_api, cached_deezer_api, deezer_api, favorites
+            )
+    finally:
+        # access times of cache hits are written in batches, this writes the last one
+        cache.close()
+
+
+def watch_metrics(path: str) -> None:
+    """Writes a metrics snapshot to path whenever the process gets SIGUSR1"""
+    if not hasattr(signal, "SIGUSR1"):
+        return
 
+    def on_signal(signum, frame) -> None:
+        # the interrupted code may hold the registry lock, so dump from another thread
+        threading.Thread(target=METRICS.dump, args=(path,), daemon=True).start()
 
-def convert_playlist(pl_name: str, from_api: MusicApi, to_api: MusicApi) -> None:
+    signal.signal(signal.SIGUSR1, on_signal)
+
+
+def convert_playlist(
+    pl_name: str,
+    from_api: MusicApi,
+    to_api: MusicApi,
+    resume: bool = False,
+    processes: int = 0,
+    albums: bool = False,
+    artists: bool = False,
+    favorites: FavoritesIndex | None = None,
+) -> None:
     """Converts playlist from one platform to another"""
     playlists = from_api.get_user_playlists()
     chosen_playlist = next((p for p in playlists if p.name == pl_name), None)
@@ -22,24 +233,297 @@ def convert_playlist(pl_name: str, from_api: MusicApi, to_api: MusicApi) -> None
         logger.log_error(logger.pretty_list(playlists))
         return
 
-    mapped = find_songs_async(chosen_playlist.songs, to_api)
+    convert_songs(
+        chosen_playlist.songs, to_api, resume, processes, albums, artists, favorites
+    )
+
+
+def convert_library(
+    from_api: YTMusicApi,
+    to_api: MusicApi,
+    resume: bool = False,
+    processes: int = 0,
+    albums: bool = False,
+    artists: bool = False,
+    favorites: FavoritesIndex | None = None,
+) -> None:
+    """
+    Converts every playlist, liked and library song, matching each track once
+    however many collections it is in, and writes what each collection maps to
+    """
+    library = Library()
+    for playlist in from_api.get_user_playlists(prefetch=True):
+        library.add_collection(playlist.id, playlist.name, playlist.songs)
+    library.add_collection("liked", "Liked songs", from_api.get_liked_songs())
+    library.add_collection("library", "Library songs", from_api.get_library_songs())
+    logger.log_message(str(library))
 
-    valid = len([x for x in mapped if len(mapped[x]) > 0])
-    logger.log_success(f"Found {valid} of {len(mapped)}")
+    records = convert_songs(
+        library.songs, to_api, resume, processes, albums, artists, favorites
+    )
+
+    collections = library.fan_out({r.song.id: r for r in records})
     filemanager.create_json_file(
-        "export.json",
-        {og_id: [s.id for s in songs] for (og_id, songs) in mapped.items()},
+        LIBRARY_PATH,
+        {
+            collection_id: {
+                "name": library.names[collection_id],
+                "songs": [
+                    {
+                        "id": song.id,
+                        "target": record.target_id if record is not None else None,
+                        "tier": record.tier if record is not None else "none",
+                    }
+                    for (song, record) in entries
+                ],
+            }
+            for (collection_id, entries) in collections.items()
+        },
     )
+    logger.log_success(f"Wrote {len(collections)} collections to {LIBRARY_PATH}")
+
+
+def convert_songs(
+    songs: list[Song],
+    to_api: MusicApi,
+    resume: bool = False,
+    processes: int = 0,
+    albums: bool = False,
+    artists: bool = False,
+    favorites: FavoritesIndex | None = None,
+) -> list[ExportRecord]:
+    """Matches songs, journaling results and writing them to the export"""
+    journal = Journal(JOURNAL_PATH)
+    if not resume:
+        journal.clear()
+
+    resolved = journal.load({s.id for s in songs})
+    isrc_map = IsrcMap(ISRC_MAP_PATH)
+    songs = isrc_map.annotate([s for s in songs if s.id not in resolved])
+    if len(resolved) > 0:
+        logger.log_message(f"Resuming: {len(resolved)} songs already resolved")
+
+    records = [ExportRecord.from_dict(entry) for entry in resolved.values()]
+    with ExportWriter(EXPORT_PATH) as writer:
+        for record in records:
+            writer.write(record)
+
+        def on_result(result: MatchResult) -> None:
+            record = ExportRecord.from_match(result)
+            journal.append(record.to_dict())
+            writer.write(record)
+            records.append(record)
+            isrc_map.record(result)
+
+        if favorites is not None:
+            songs = find_songs_in_favorites(songs, favorites, on_result)
+        if albums:
+            songs = find_songs_by_album(songs, to_api, on_result=on_result)
+        if artists:
+            songs = find_songs_by_artist(songs, to_api, on_result=on_result)
+
+        planner = QueryPlanner(QUERY_STATS_PATH)
+        try:
+            if processes > 0:
+                find_songs_parallel(
+                    songs, to_api, processes, on_result=on_result, planner=planner
+                )
+            else:
+                find_songs_async(songs, to_api, on_result=on_result, planner=planner)
+            isrc_map.learn(to_api)
+        finally:
+            planner.save()
+            isrc_map.save()
+
+    valid = len([r for r in records if len(r.candidate_ids) > 0])
+    logger.log_success(f"Found {valid} of {len(records)}")
+    if isinstance(to_api, CachedMusicApi):
+        logger.log_message(str(to_api.cache))
+    logger.log_message(str(to_api.limiter))
+    logger.log_message(str(FLIGHTS))
+    logger.log_message(str(isrc_map))
+    planner.log_report()
+    return records
+
+
+def migrate_playlist(
+    pl_name: str,
+    from_api: MusicApi,
+    search_api: MusicApi,
+    target_api: DeezerApi,
+    favorites: FavoritesIndex | None = None,
+) -> None:
+    """Matches a playlist and adds identical matches while matching continues"""
+    playlists = from_api.get_user_playlists()
+    chosen_playlist = next((p for p in playlists if p.name == pl_name), None)
+
+    if chosen_playlist is None:
+        logger.log_error(f"Can't find playlist with name: {pl_name}")
+        return
+
+    planner = QueryPlanner(QUERY_STATS_PATH)
+    isrc_map = IsrcMap(ISRC_MAP_PATH)
+    with ExportWriter(EXPORT_PATH) as writer:
+
+        def on_result(result: MatchResult) -> None:
+            writer.write(ExportRecord.from_match(result))
+            isrc_map.record(result)
+
+        songs = isrc_map.annotate(chosen_playlist.songs)
+        if favorites is not None:
+            songs = find_songs_in_favorites(songs, favorites, on_result)
+        try:
+            summary = asyncio.run(
+                migrate_songs(
+                    songs,
+                    search_api,
+                    target_api,
+                    on_result=on_result,
+                    planner=planner,
+                    favorite_ids=favorites.ids if favorites is not None else None,
+                )
+            )
+            isrc_map.learn(search_api)
+        finally:
+            planner.save()
+            isrc_map.save()
+    logger.log_success(str(summary))
+    planner.log_report()
+
+
+def sync_playlist(
+    pl_name: str,
+    from_api: MusicApi,
+    search_api: MusicApi,
+    target_api: DeezerApi,
+    favorites: FavoritesIndex | None = None,
+) -> None:
+    """
+    Matches and adds only songs added to a playlist since its last sync,
+    and removes favorites the sync added for songs taken out of it
+    """
+    playlists = from_api.get_user_playlists()
+    chosen_playlist = next((p for p in playlists if p.name == pl_name), None)
+
+    if chosen_playlist is None:
+        logger.log_error(f"Can't find playlist with name: {pl_name}")
+        return
+
+    state = SyncState(SYNC_PATH)
+    diff = diff_playlist(state.snapshot(pl_name), chosen_playlist.songs)
+    logger.log_message(str(diff))
+    records = {r.song.id: r for r in diff.kept}
+
+    # removed songs leave the snapshot before anything can interrupt matching,
+    # and their targets stay pending until deezer confirms the removal
+    state.update(pl_name, diff.kept)
+    try:
+        for target_id in state.release(diff.removed):
+            try:
+                target_api.remove_song_by_id(target_id)
+                METRICS.inc("removes_total", status="removed")
+                state.mark_removed([target_id])
+            except Exception as exc:
+                logger.log_error(f"Failed removing {target_id}: {exc}")
+                METRICS.inc("removes_total", status="failed")
+    finally:
+        state.save()
+
+    try:
+        if len(diff.added) > 0:
+            planner = QueryPlanner(QUERY_STATS_PATH)
+            isrc_map = IsrcMap(ISRC_MAP_PATH)
+
+            def on_result(result: MatchResult) -> None:
+                records[result.source.id] = ExportRecord.from_match(result)
+                isrc_map.record(result)
+
+            added = isrc_map.annotate(diff.added)
+            if favorites is not None:
+                # already there, so recorded without being marked as added by the sync
+                added = find_songs_in_favorites(added, favorites, on_result)
+            try:
+                summary = asyncio.run(
+                    migrate_songs(
+                        added,
+                        search_api,
+                        target_api,
+                        on_result=on_result,
+                        planner=planner,
+                        on_added=lambda o: state.mark_added([o.song_id]),
+                        favorite_ids=favorites.ids if favorites is not None else None,
+                    )
+                )
+                isrc_map.learn(search_api)
+            finally:
+                planner.save()
+                isrc_map.save()
+            logger.log_success(str(summary))
+            planner.log_report()
+    finally:
+        # even when interrupted, songs matched so far are kept and favorites added
+        # so far are owned by the sync, the rest is retried next time
+        state.update(
+            pl_name, [records[s.id] for s in chosen_playlist.songs if s.id in records]
+        )
+        state.save()
+    logger.log_success(str(state))
+
+
+def rescore_playlist(
+    pl_name: str, from_api: MusicApi, cached_api: CachedMusicApi
+) -> None:
+    """Re-matches a playlist against every cached search result, without network"""
+    playlists = from_api.get_user_playlists()
+    chosen_playlist = next((p for p in playlists if p.name == pl_name), None)
+
+    if chosen_playlist is None:
+        logger.log_error(f"Can't find playlist with name: {pl_name}")
+        return
+
+    sources = chosen_playlist.songs
+    songs = [possibility.format_song(s) for s in sources]
+    pool = [possibility.format_song(s) for s in cached_api.cached_songs()]
+    scored = BatchScorer(pool).score(songs)
+
+    valid = 0
+    with ExportWriter(EXPORT_PATH) as writer:
+        for index, source in enumerate(sources):
+            found = scored[source.id]
+            _, chosen = select_best(found, index + 1)
+            writer.write(ExportRecord.from_match(MatchResult(source, found, chosen)))
+            valid += 1 if len(chosen) > 0 else 0
+
+    logger.log_success(f"Found {valid} of {len(songs)} using {len(pool)} cached songs")
+
+
+def deezer_add(to_api: DeezerApi, follow: bool = False, batch_size: int = 50) -> None:
+    """
+    Adds every unambiguous match from the export to deezer favorites.
+    With follow, records are consumed while the export is still being written
+    """
+    favorites = to_api.get_favorite_ids()
+    outcomes = []
+    batch: list[str] = []
 
+    def flush() -> None:
+        report = to_api.add_songs_by_ids(batch, favorites=favorites)
+        for outcome in report.with_status(AddStatus.FAILED):
+            logger.log_error(str(outcome))
+        outcomes.extend(report.outcomes)
+        batch.clear()
 
-def deezer_add(pl_name: str, to_api: DeezerApi) -> None:
-    export = filemanager.read_json_file("export.json")
-    for key, val in export.items():
-        if len(val) != 1:
-            logger.log_error(f"Skipping track: {key}")
+    for record in read_export(EXPORT_PATH, follow):
+        if record.target_id is None:
+            logger.log_error(f"Skipping track: {record.song.pretty()} ({record.tier})")
             continue
+        batch.append(record.target_id)
+        if len(batch) >= batch_size:
+            flush()
+    if len(batch) > 0:
+        flush()
 
-        print(to_api.add_song_by_id(val[0]))
+    logger.log_success(str(AddReport(outcomes)))
 
 
 if __name__ == "__main__":
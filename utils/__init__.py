@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import Type
 import unicodedata
 import re
@@ -31,3 +32,9 @@ def slugify(value, allow_unicode=False):
         )
     value = re.sub(r"[^\w\s-]", "", value.lower())
     return re.sub(r"[-\s]+", "-", value).strip("-_")
+
+
+@lru_cache(maxsize=1 << 16)
+def slugify_cached(value: str | None) -> str:
+    """slugify for values that repeat a lot (authors, albums)"""
+    return slugify(value)
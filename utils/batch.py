@@ -0,0 +1,162 @@
+from typing import TYPE_CHECKING
+
+from classes import Song
+from utils import similarity
+
+try:
+    import numpy as np
+except ImportError:  # optional, falls back to scoring pair by pair
+    if not TYPE_CHECKING:  # type checkers see the module, code checks for None
+        np = None
+
+# upper bound on songs x candidates per chunk: each matrix of a chunk
+# then takes at most 32 MB (float64), whatever the size of the pool
+MAX_CELLS = 4_000_000
+
+
+class BatchScorer:
+    """
+    Scores every source song against a whole pool of candidates at once.
+    Durations, name lengths and author tokens of the pool are encoded into
+    numpy arrays, so cheap checks (duration delta, author overlap, name
+    length bound) run as matrix operations over chunks of source songs,
+    shrunk so that a chunk never has more than max_cells pairs.
+    Only the pairs that survive get the exact name comparison.
+    Songs and candidates are expected to be formatted already
+    """
+
+    _candidates: list[Song]
+    _chunk_size: int
+    _tokens: dict[str, int]
+    _durations: "np.ndarray"
+    _name_lengths: "np.ndarray"
+    _token_starts: "np.ndarray"
+    _token_candidates: "np.ndarray"
+
+    def __init__(
+        self, candidates: list[Song], chunk_size: int = 512, max_cells: int = MAX_CELLS
+    ) -> None:
+        unique: dict[str, Song] = {}
+        for candidate in candidates:
+            unique.setdefault(candidate.id, candidate)
+        self._candidates = list(unique.values())
+        self._chunk_size = max(
+            1, min(chunk_size, max_cells // max(1, len(self._candidates)))
+        )
+        self._tokens = {}
+
+        if np is not None:
+            self._encode()
+
+    @property
+    def candidates(self) -> list[Song]:
+        """Returns the candidate pool, deduplicated by id"""
+        return self._candidates
+
+    def _encode(self) -> None:
+        keys = [c.normalized for c in self._candidates]
+        self._durations = np.array(
+            [np.nan if k.duration is None else k.duration for k in keys],
+            dtype=np.float64,
+        )
+        self._name_lengths = np.array([len(k.name) for k in keys], dtype=np.int64)
+
+        # author token id -> candidate indices, stored csr-style
+        postings: list[list[int]] = []
+        for index, key in enumerate(keys):
+            for author in key.authors:
+                token = self._tokens.setdefault(author, len(self._tokens))
+                if token == len(postings):
+                    postings.append([])
+                postings[token].append(index)
+
+        self._token_starts = np.zeros(len(postings) + 1, dtype=np.int64)
+        self._token_starts[1:] = np.cumsum([len(p) for p in postings])
+        self._token_candidates = np.array(
+            [index for p in postings for index in p], dtype=np.int64
+        )
+
+    def score(
+        self, songs: list[Song], include_others: bool = False
+    ) -> dict[str, similarity.SimilarSongs]:
+        """
+        Returns best matches for every song, keyed by song id.
+        'others' (similar name, no common author) are only collected
+        if include_others is set, since that requires scoring many more pairs
+        """
+        if np is None:
+            return self._score_slow(songs, include_others)
+
+        results: dict[str, similarity.SimilarSongs] = {}
+        for start in range(0, len(songs), self._chunk_size):
+            chunk = songs[start : start + self._chunk_size]
+            results.update(self._score_chunk(chunk, include_others))
+        return results
+
+    def _score_chunk(
+        self, songs: list[Song], include_others: bool
+    ) -> dict[str, similarity.SimilarSongs]:
+        keys = [s.normalized for s in songs]
+        cutoff = similarity.NAME_SCORER.cutoff
+
+        durations = np.array(
+            [np.nan if k.duration is None else k.duration for k in keys],
+            dtype=np.float64,
+        )
+        similar_duration = (
+            np.abs(durations[:, None] - self._durations[None, :]) < 3
+        )  # nan compares as False, same as a missing duration
+
+        name_lengths = np.array([len(k.name) for k in keys], dtype=np.int64)
+        left = name_lengths[:, None]
+        right = self._name_lengths[None, :]
+        total = left + right
+        with np.errstate(divide="ignore", invalid="ignore"):
+            possible_names = (2.0 * np.minimum(left, right) / total > cutoff) | (
+                total == 0
+            )
+
+        common_author = np.zeros((len(songs), len(self._candidates)), dtype=bool)
+        for row, key in enumerate(keys):
+            for author in key.authors:
+                token = self._tokens.get(author)
+                if token is None:
+                    continue
+                begin, end = self._token_starts[token], self._token_starts[token + 1]
+                common_author[row, self._token_candidates[begin:end]] = True
+
+        survivors = possible_names if include_others else possible_names & common_author
+
+        results: dict[str, similarity.SimilarSongs] = {}
+        for row, song in enumerate(songs):
+            found = similarity.SimilarSongs(song)
+            for column in np.flatnonzero(survivors[row]):
+                candidate = self._candidates[column]
+                if not similarity.have_similar_names(keys[row], candidate.normalized):
+                    continue
+                similarity.classify(
+                    found,
+                    candidate,
+                    bool(common_author[row, column]),
+                    bool(similar_duration[row, column]),
+                )
+            results[song.id] = similarity.promote_similar(found)
+        return results
+
+    def _score_slow(
+        self, songs: list[Song], include_others: bool
+    ) -> dict[str, similarity.SimilarSongs]:
+        results: dict[str, similarity.SimilarSongs] = {}
+        for song in songs:
+            matcher = similarity.SongMatcher(song)
+            matcher.add(self._candidates)
+            found = matcher.result
+            if not include_others:
+                trimmed = similarity.SimilarSongs(song)
+                for sim in found.similar:
+                    trimmed.add_similar(sim)
+                for ident in found.identical:
+                    trimmed.add_identical(ident)
+                found = trimmed
+            results[song.id] = found
+        return results
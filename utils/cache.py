@@ -0,0 +1,182 @@
+from typing import Any
+import json
+import sqlite3
+import threading
+import time
+
+from utils import assert_parameter
+from utils.metrics import METRICS
+
+# hits whose access times are kept in memory before being written in one go
+ACCESS_BATCH = 256
+
+
+class SearchCache:
+    """
+    A sqlite backed key/value cache with per-entry ttl and lru eviction.
+    Access times of hits are batched in memory and written on the next set,
+    every ACCESS_BATCH hits and on close
+    """
+
+    _path: str
+    _ttl: float
+    _max_entries: int
+    _connection: sqlite3.Connection
+    _lock: threading.Lock
+    _accessed: dict[str, float]
+    _hits: int
+    _misses: int
+
+    def __init__(
+        self,
+        path: str = "search_cache.sqlite",
+        ttl: float = 7 * 24 * 60 * 60,
+        max_entries: int = 100_000,
+    ) -> None:
+        assert_parameter(path, str, "path")
+        assert_parameter(ttl, (int, float), "ttl")  # type: ignore
+        assert_parameter(max_entries, int, "max_entries")
+
+        if max_entries < 1:
+            raise ValueError("Cache must be able to hold at least 1 entry")
+
+        self._path = path
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._accessed = {}
+        self._hits = 0
+        self._misses = 0
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+        )
+        self._connection.commit()
+
+    @property
+    def hits(self) -> int:
+        """Returns amount of cache hits"""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """Returns amount of cache misses"""
+        return self._misses
+
+    @property
+    def hit_rate(self) -> float:
+        """Returns hits / (hits + misses)"""
+        total = self._hits + self._misses
+        return self._hits / total if total > 0 else 0.0
+
+    def get(self, key: str) -> Any | None:
+        """Returns cached value or None if missing/expired"""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self._misses += 1
+                METRICS.inc("cache_lookups_total", result="miss")
+                return None
+
+            value, expires = row
+            if expires < now:
+                self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._connection.commit()
+                self._misses += 1
+                METRICS.inc("cache_lookups_total", result="expired")
+                return None
+
+            self._accessed[key] = now
+            if len(self._accessed) >= ACCESS_BATCH:
+                self._flush_accessed()
+                self._connection.commit()
+            self._hits += 1
+            METRICS.inc("cache_lookups_total", result="hit")
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        """Stores a json-serializable value, evicting least recently used entries"""
+        now = time.time()
+        expires = now + (self._ttl if ttl is None else ttl)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires, now),
+            )
+            self._accessed.pop(key, None)
+            # eviction goes by access time, so it has to be up to date
+            self._flush_accessed()
+            self._evict()
+            self._connection.commit()
+
+    def values(self, prefix: str = "") -> list[Any]:
+        """Returns every unexpired value whose key starts with prefix"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT value FROM entries WHERE key >= ? AND key < ? AND expires >= ?",
+                (prefix, prefix + "\uffff", time.time()),
+            ).fetchall()
+        return [json.loads(value) for (value,) in rows]
+
+    def clear(self) -> None:
+        """Removes every entry"""
+        with self._lock:
+            self._connection.execute("DELETE FROM entries")
+            self._connection.commit()
+            self._accessed.clear()
+
+    def close(self) -> None:
+        """Writes pending access times and closes underlying database"""
+        with self._lock:
+            self._flush_accessed()
+            self._connection.commit()
+            self._connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[
+                0
+            ]
+
+    def _flush_accessed(self) -> None:
+        """Writes access times of hits since the last flush, without committing"""
+        if len(self._accessed) == 0:
+            return
+        self._connection.executemany(
+            "UPDATE entries SET accessed = ? WHERE key = ?",
+            [(accessed, key) for (key, accessed) in self._accessed.items()],
+        )
+        self._accessed.clear()
+
+    def _evict(self) -> None:
+        """Drops expired entries, then the least recently used ones over the cap"""
+        count = self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count <= self._max_entries:
+            return
+        self._connection.execute(
+            "DELETE FROM entries WHERE expires < ?", (time.time(),)
+        )
+        count = self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count <= self._max_entries:
+            return
+        self._connection.execute(
+            "DELETE FROM entries WHERE key IN "
+            "(SELECT key FROM entries ORDER BY accessed ASC LIMIT ?)",
+            (count - self._max_entries,),
+        )
+
+    def __str__(self) -> str:
+        return f"CACHE (path: {self._path} | hits: {self.hits} | misses: {self.misses})"
@@ -0,0 +1,213 @@
+from typing import Iterator
+import json
+import os
+import time
+
+from classes import Song
+from utils import assert_parameter, filemanager
+from utils.similarity import MatchResult
+
+
+class ExportRecord:
+    """A single line of an export: a source song and what it was matched to"""
+
+    _song: Song
+    _target_id: str | None
+    _candidate_ids: list[str]
+    _tier: str
+    _score: float | None
+
+    def __init__(
+        self,
+        song: Song,
+        target_id: str | None,
+        candidate_ids: list[str],
+        tier: str,
+        score: float | None,
+    ) -> None:
+        self._song = song
+        self._target_id = target_id
+        self._candidate_ids = candidate_ids
+        self._tier = tier
+        self._score = score
+
+    @property
+    def song(self) -> Song:
+        """Returns source song"""
+        return self._song
+
+    @property
+    def target_id(self) -> str | None:
+        """Returns the chosen id, None if there was no unambiguous match"""
+        return self._target_id
+
+    @property
+    def candidate_ids(self) -> list[str]:
+        """Returns ids of every selected candidate"""
+        return self._candidate_ids
+
+    @property
+    def tier(self) -> str:
+        """Returns match tier: identical/similar/other/none"""
+        return self._tier
+
+    @property
+    def score(self) -> float | None:
+        """Returns name similarity of the chosen candidate"""
+        return self._score
+
+    @staticmethod
+    def from_match(result: MatchResult) -> "ExportRecord":
+        """Creates a record out of a match result"""
+        return ExportRecord(
+            result.source,
+            result.target_id,
+            [s.id for s in result.chosen],
+            result.tier,
+            result.score,
+        )
+
+    def to_dict(self) -> dict:
+        """Returns a json-serializable representation"""
+        return {
+            "id": self._song.id,
+            "song": self._song.to_dict(),
+            "target": self._target_id,
+            "candidates": self._candidate_ids,
+            "tier": self._tier,
+            "score": self._score,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "ExportRecord":
+        """Creates a record from its dict representation"""
+        return ExportRecord(
+            Song.from_dict(data["song"]),
+            data.get("target"),
+            list(data.get("candidates", [])),
+            data.get("tier", "none"),
+            data.get("score"),
+        )
+
+
+class ExportWriter:
+    """
+    Writes records as json lines into '<path>.part', flushing every record,
+    and atomically renames it to path once closed without errors
+    (or to '<path>.failed' if an exception interrupted the export)
+    """
+
+    _path: str
+    _file = None
+
+    def __init__(self, path: str, overwrite: bool = True) -> None:
+        assert_parameter(path, str, "path")
+
+        if not path.endswith(".jsonl"):
+            raise ValueError(f"{path} is not a valid json lines filename")
+
+        if not overwrite and filemanager.does_file_exist(path):
+            raise FileExistsError(f"File already exists: {path}")
+
+        self._path = path
+
+    @property
+    def path(self) -> str:
+        """Returns final export path"""
+        return self._path
+
+    @property
+    def partial_path(self) -> str:
+        """Returns the path records are written to until the export is done"""
+        return self._path + ".part"
+
+    def __enter__(self) -> "ExportWriter":
+        # followers must not mistake a previous export for this one, nor keep
+        # reading a leftover part file truncated under them
+        for path in (self._path, self.partial_path):
+            if filemanager.does_file_exist(path):
+                os.remove(path)
+        self._file = open(self.partial_path, "w", encoding="utf-8")
+        return self
+
+    def write(self, record: ExportRecord) -> None:
+        """Appends one record"""
+        if self._file is None:
+            raise RuntimeError("ExportWriter must be used as a context manager")
+        self._file.write(json.dumps(record.to_dict()) + "\n")
+        self._file.flush()
+
+    def __exit__(self, exception, value, tb) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        if exception is None:
+            os.replace(self.partial_path, self._path)
+        else:
+            # keep what was written for inspection, but never as a complete export
+            os.replace(self.partial_path, self._path + ".failed")
+
+
+def _mtime(path: str) -> float | None:
+    """Returns when path was last written, None if it does not exist"""
+    return os.path.getmtime(path) if filemanager.does_file_exist(path) else None
+
+
+def read_export(
+    path: str, follow: bool = False, poll: float = 0.5, timeout: float = 600.0
+) -> Iterator[ExportRecord]:
+    """
+    Yields records one by one.
+    With follow, waits up to timeout seconds for an export written after the call,
+    reads '<path>.part' while it is still being written and stops once the writer
+    is done with it, raising if the writer failed
+    """
+    assert_parameter(path, str, "path")
+
+    if not follow:
+        if not filemanager.does_file_exist(path):
+            raise FileNotFoundError(f"File does not exist: {path}")
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                yield ExportRecord.from_dict(json.loads(line))
+        return
+
+    started = time.time()
+    partial_path = path + ".part"
+    failed_path = path + ".failed"
+    # files left by an earlier (or killed) run are not the export being waited for
+    stale = _mtime(path), _mtime(failed_path), _mtime(partial_path)
+    while _mtime(partial_path) in (None, stale[2]):
+        if _mtime(path) not in (None, stale[0]):
+            yield from read_export(path)
+            return
+        if _mtime(failed_path) not in (None, stale[1]):
+            raise RuntimeError(f"Export failed, see {failed_path}")
+        if time.time() - started > timeout:
+            raise TimeoutError(f"No export started within {timeout:g}s: {path}")
+        time.sleep(poll)
+
+    with open(partial_path, "r", encoding="utf-8") as file:
+        buffer = ""
+        while True:
+            chunk = file.readline()
+            if chunk == "":
+                if filemanager.does_file_exist(partial_path):
+                    time.sleep(poll)
+                    continue
+                # the writer renamed the file away, so all it wrote is readable now
+                chunk = file.read()
+                if chunk == "":
+                    break
+            buffer += chunk
+            while "\n" in buffer:
+                line, buffer = buffer.split("\n", 1)
+                yield ExportRecord.from_dict(json.loads(line))
+
+    if not filemanager.does_file_exist(path) and filemanager.does_file_exist(
+        failed_path
+    ):
+        raise RuntimeError(f"Export failed, see {failed_path}")
@@ -0,0 +1,68 @@
+from typing import TYPE_CHECKING
+import difflib
+
+try:
+    from rapidfuzz.distance import Indel
+except ImportError:  # optional speedup
+    if not TYPE_CHECKING:  # type checkers see the module, code checks for None
+        Indel = None
+
+
+BACKENDS = ("auto", "rapidfuzz", "difflib")
+
+
+class NameScorer:
+    """
+    Answers "is difflib's ratio(left, right) above cutoff" as cheaply as possible.
+    Cheap upper bounds reject most pairs before the exact ratio is computed:
+    lengths, then either rapidfuzz's indel similarity (an lcs based bound that
+    is never below difflib's ratio) or difflib's own quick_ratio.
+    Accept/reject results are always the same as the plain difflib check
+    """
+
+    _cutoff: float
+    _fast: bool
+
+    def __init__(self, cutoff: float = 0.8, backend: str = "auto") -> None:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}, expected one of {BACKENDS}")
+        if backend == "rapidfuzz" and Indel is None:
+            raise ImportError("rapidfuzz backend requested but it is not installed")
+
+        self._cutoff = cutoff
+        self._fast = Indel is not None and backend != "difflib"
+
+    @property
+    def cutoff(self) -> float:
+        """Returns the ratio names have to be above to be similar"""
+        return self._cutoff
+
+    @property
+    def backend(self) -> str:
+        """Returns the backend used for pre-filtering"""
+        return "rapidfuzz" if self._fast else "difflib"
+
+    def ratio(self, left: str, right: str) -> float:
+        """Returns exact difflib ratio"""
+        return difflib.SequenceMatcher(None, left, right).ratio()
+
+    def is_similar(self, left: str, right: str) -> bool:
+        """Returns True if ratio(left, right) > cutoff"""
+        if left == right:
+            return 1.0 > self._cutoff
+
+        total = len(left) + len(right)
+        # at best every character of the shorter name matches
+        if 2.0 * min(len(left), len(right)) / total <= self._cutoff:
+            return False
+
+        if self._fast:
+            bound = Indel.normalized_similarity(left, right, score_cutoff=self._cutoff)
+            if bound <= self._cutoff:
+                return False
+            return self.ratio(left, right) > self._cutoff
+
+        matcher = difflib.SequenceMatcher(None, left, right)
+        if matcher.quick_ratio() <= self._cutoff:
+            return False
+        return matcher.ratio() > self._cutoff
@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from classes import Song, MusicApi
+from utils import filemanager, logger
+from utils.ratelimit import RateLimitExceeded
+from utils.similarity import MatchResult
+
+
+class IsrcMap:
+    """
+    Persisted source song id -> ISRC map, for sources whose metadata has none.
+    Filled with the ISRC of every identical match: search results carry none,
+    so those are looked up by id once matching is done (see learn).
+    Can be extended by hand: {"<video id>": "<isrc>", ...}
+    """
+
+    _path: str | None
+    _isrcs: dict[str, str]
+    _pending: dict[str, str]
+    _lock: threading.Lock
+    _recorded: int
+
+    def __init__(self, path: str | None = "isrc_map.json") -> None:
+        self._path = path
+        self._isrcs = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._recorded = 0
+
+        if path is not None and filemanager.does_file_exist(path):
+            self._isrcs = dict(filemanager.read_json_file(path))
+
+    @property
+    def recorded(self) -> int:
+        """Returns amount of ISRCs learned this run"""
+        return self._recorded
+
+    def get(self, song: Song) -> str | None:
+        """Returns ISRC of a song, from its own metadata or from the map"""
+        if song.isrc is not None:
+            return song.isrc
+        return self._isrcs.get(song.id)
+
+    def annotate(self, songs: list[Song]) -> list[Song]:
+        """Returns songs with every ISRC the map knows filled in"""
+        return [
+            (
+                s
+                if s.isrc is not None or s.id not in self._isrcs
+                else s.with_isrc(self._isrcs[s.id])
+            )
+            for s in songs
+        ]
+
+    def record(self, result: MatchResult) -> None:
+        """
+        Remembers the ISRC of an identical match, or its target id
+        to look the ISRC up later if the match came without one
+        """
+        if result.tier != "identical" or result.target_id is None:
+            return
+        source = result.source
+        isrc = result.chosen[0].isrc
+        with self._lock:
+            if isrc is not None:
+                self._learn(source.id, isrc)
+            elif source.isrc is None and source.id not in self._isrcs:
+                self._pending[source.id] = result.target_id
+
+    def _learn(self, song_id: str, isrc: str) -> None:
+        if self._isrcs.get(song_id) != isrc:
+            self._isrcs[song_id] = isrc
+            self._recorded += 1
+
+    def learn(self, api: MusicApi, workers: int = 4) -> None:
+        """
+        Looks up ISRCs of identical matches recorded without one,
+        one id lookup per match (under the api's rate limit)
+        """
+        with self._lock:
+            pending = list(self._pending.items())
+            self._pending.clear()
+        if len(pending) == 0:
+            return
+
+        def fetch(entry: tuple[str, str]) -> tuple[str, str | None]:
+            song_id, target_id = entry
+            try:
+                found = api.search_song_id(target_id)
+            except RateLimitExceeded:
+                return song_id, None
+            except Exception as exc:
+                logger.log_error(f"Failed looking up ISRC of {target_id}: {exc}")
+                return song_id, None
+            return song_id, found.isrc if found is not None else None
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for song_id, isrc in executor.map(fetch, pending):
+                if isrc is not None:
+                    with self._lock:
+                        self._learn(song_id, isrc)
+        logger.log_message(f"Looked up ISRCs of {len(pending)} matches: {self}")
+
+    def save(self) -> None:
+        """Persists the map for the next run"""
+        if self._path is None:
+            return
+        with self._lock:
+            filemanager.create_json_file(self._path, self._isrcs)
+
+    def __len__(self) -> int:
+        return len(self._isrcs)
+
+    def __str__(self) -> str:
+        return f"ISRC MAP (path: {self._path} | known: {len(self)} | learned: {self._recorded})"
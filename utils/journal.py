@@ -0,0 +1,72 @@
+import json
+import os
+import threading
+
+from utils import assert_parameter, filemanager
+
+
+class Journal:
+    """An append-only json lines log of per-song match results (export records)"""
+
+    _path: str
+    _lock: threading.Lock
+
+    def __init__(self, path: str) -> None:
+        assert_parameter(path, str, "path")
+
+        if not path.endswith(".jsonl"):
+            raise ValueError(f"{path} is not a valid json lines filename")
+
+        self._path = path
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        """Returns journal path"""
+        return self._path
+
+    def load(self, ids: set[str] | None = None) -> dict[str, dict]:
+        """
+        Returns already resolved songs as {song id: entry}. With ids, only those
+        songs: the journal may hold songs of another run (another playlist)
+        """
+        resolved: dict[str, dict] = {}
+        if not filemanager.does_file_exist(self._path):
+            return resolved
+
+        valid_size = 0
+        with open(self._path, "rb") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a crash mid-write leaves a truncated last line, redo that song
+                    break
+                if ids is None or entry["id"] in ids:
+                    resolved[entry["id"]] = entry
+                valid_size += len(line)
+
+        if valid_size < os.path.getsize(self._path):
+            # drop the partial line so new entries don't get glued onto it
+            os.truncate(self._path, valid_size)
+        return resolved
+
+    def append(self, entry: dict) -> None:
+        """Durably appends one entry, entries are keyed by their 'id'"""
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            with open(self._path, "ab+") as file:
+                # a last line written without its newline would swallow this entry
+                if file.seek(0, os.SEEK_END) > 0:
+                    file.seek(-1, os.SEEK_END)
+                    if file.read(1) != b"\n":
+                        line = "\n" + line
+                file.write(line.encode("utf-8"))
+                file.flush()
+                os.fsync(file.fileno())
+
+    def clear(self) -> None:
+        """Removes the journal"""
+        with self._lock:
+            if filemanager.does_file_exist(self._path):
+                os.remove(self._path)
@@ -0,0 +1,93 @@
+from typing import TypeVar
+
+from classes import Song
+from utils import possibility, slugify_cached
+
+T = TypeVar("T")
+SongKey = tuple[str, frozenset[str], int | None]
+
+
+def song_key(song: Song) -> SongKey:
+    """
+    Returns (title, authors, duration) in normalized form, so the same track
+    saved under different ids maps to the same key
+    """
+    formatted = possibility.format_song(song)
+    key = formatted.normalized
+    return (slugify_cached(formatted.name), key.authors, key.duration)
+
+
+class Library:
+    """
+    Songs of many collections (playlists, liked songs, ...) deduped by id and
+    by normalized key, so each track is matched once and its result shared.
+    Collections are keyed by id, names are only labels (they need not be unique)
+    """
+
+    _songs: dict[str, Song]
+    _ids: dict[str, str]
+    _keys: dict[SongKey, str]
+    _collections: dict[str, list[Song]]
+    _names: dict[str, str]
+
+    def __init__(self) -> None:
+        self._songs = {}
+        self._ids = {}
+        self._keys = {}
+        self._collections = {}
+        self._names = {}
+
+    @property
+    def songs(self) -> list[Song]:
+        """Returns one song per unique track"""
+        return list(self._songs.values())
+
+    @property
+    def collections(self) -> dict[str, list[Song]]:
+        """Returns songs of every collection by collection id, as added"""
+        return self._collections
+
+    @property
+    def names(self) -> dict[str, str]:
+        """Returns name of every collection by collection id"""
+        return self._names
+
+    @property
+    def total(self) -> int:
+        """Returns amount of songs over every collection, duplicates included"""
+        return sum(len(songs) for songs in self._collections.values())
+
+    def add_collection(self, collection_id: str, name: str, songs: list[Song]) -> None:
+        """Adds every song of a collection, merging tracks already known"""
+        self._names[collection_id] = name
+        self._collections.setdefault(collection_id, []).extend(songs)
+        for song in songs:
+            if song.id in self._ids:
+                continue
+            key = song_key(song)
+            unique_id = self._keys.get(key)
+            if unique_id is None:
+                unique_id = song.id
+                self._keys[key] = unique_id
+                self._songs[unique_id] = song
+            self._ids[song.id] = unique_id
+
+    def unique_id(self, song: Song) -> str | None:
+        """Returns id of the song that stands for this one"""
+        return self._ids.get(song.id)
+
+    def fan_out(self, results: dict[str, T]) -> dict[str, list[tuple[Song, T | None]]]:
+        """
+        Returns every collection (by id) with each song paired to the result
+        of its unique track (results are keyed by unique id, None if missing)
+        """
+        return {
+            collection_id: [(s, results.get(self._ids[s.id])) for s in songs]
+            for (collection_id, songs) in self._collections.items()
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"LIBRARY (collections: {len(self._collections)} | songs: {self.total} "
+            + f"| unique: {len(self._songs)})"
+        )
@@ -0,0 +1,231 @@
+from contextlib import contextmanager
+from typing import Iterator
+import bisect
+import json
+import os
+import threading
+import time
+
+# seconds, from a cached lookup up to a request stuck in retries
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    """Counts observations into fixed buckets, keeping their sum and max"""
+
+    _bounds: tuple[float, ...]
+    _counts: list[int]
+    _sum: float
+    _max: float
+
+    def __init__(self, bounds: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self._bounds = bounds
+        # the last bucket is +Inf
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+        self._max = 0.0
+
+    @property
+    def count(self) -> int:
+        """Returns amount of observations"""
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        """Returns sum of every observation"""
+        return self._sum
+
+    def observe(self, value: float) -> None:
+        """Adds one observation"""
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self._sum += value
+        self._max = max(self._max, value)
+
+    def quantile(self, q: float) -> float:
+        """Returns upper bound of the bucket the q-th quantile falls into"""
+        count = self.count
+        if count == 0:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for bound, bucket in zip(self._bounds, self._counts):
+            seen += bucket
+            if seen >= rank:
+                return min(bound, self._max)
+        return self._max
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """Returns (le, count) pairs in prometheus order"""
+        pairs = []
+        seen = 0
+        for bound, bucket in zip(self._bounds, self._counts):
+            seen += bucket
+            pairs.append((f"{bound:g}", seen))
+        pairs.append(("+Inf", seen + self._counts[-1]))
+        return pairs
+
+    def to_dict(self) -> dict:
+        """Returns a json-serializable summary"""
+        return {
+            "count": self.count,
+            "sum": self._sum,
+            "max": self._max,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": dict(self.cumulative()),
+        }
+
+
+class MetricsRegistry:
+    """Thread safe counters, gauges and latency histograms keyed by name and labels"""
+
+    _counters: dict[tuple[str, Labels], float]
+    _gauges: dict[tuple[str, Labels], float]
+    _histograms: dict[tuple[str, Labels], Histogram]
+    _lock: threading.Lock
+    _started: float
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Drops every recorded value"""
+        with self._lock:
+            self._counters = {}
+            self._gauges = {}
+            self._histograms = {}
+            self._started = time.time()
+
+    # name and value are positional-only, so any label name can be passed through
+    def inc(self, name: str, value: float = 1, /, **labels: str) -> None:
+        """Increments a counter"""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, /, **labels: str) -> None:
+        """Sets a gauge to value"""
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, /, **labels: str) -> None:
+        """Records one observation in a histogram"""
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = Histogram()
+                self._histograms[key] = histogram
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, /, **labels: str) -> Iterator[None]:
+        """Records how many seconds the block took, even if it raised"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        """Returns a json-serializable copy of every metric"""
+        with self._lock:
+            return {
+                "started": self._started,
+                "taken": time.time(),
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for ((name, labels), value) in sorted(self._counters.items())
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for ((name, labels), value) in sorted(self._gauges.items())
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **histogram.to_dict()}
+                    for ((name, labels), histogram) in sorted(
+                        self._histograms.items(), key=lambda item: item[0]
+                    )
+                ],
+            }
+
+    def to_prometheus(self) -> str:
+        """Returns every metric in prometheus text exposition format"""
+        lines: list[str] = []
+        with self._lock:
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                typed: set[str] = set()
+                for (name, labels), value in sorted(values.items()):
+                    if name not in typed:
+                        lines.append(f"# TYPE {name} {kind}")
+                        typed.add(name)
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+            typed = set()
+            for (name, labels), histogram in sorted(
+                self._histograms.items(), key=lambda item: item[0]
+            ):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                for le, count in histogram.cumulative():
+                    bucket_labels = labels + (("le", le),)
+                    lines.append(
+                        f"{name}_bucket{_format_labels(bucket_labels)} {count}"
+                    )
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:g}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """
+        Atomically writes a snapshot to path,
+        as prometheus text if it ends with '.prom', as json otherwise
+        """
+        if path.endswith(".prom"):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), indent=4)
+
+        partial_path = path + ".part"
+        with open(partial_path, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(partial_path, path)
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for (key, value) in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if len(labels) == 0:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"'))
+        for (key, value) in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for (key, value) in escaped) + "}"
+
+
+# shared by every module, so a single snapshot covers the whole run
+METRICS = MetricsRegistry()
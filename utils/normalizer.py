@@ -0,0 +1,85 @@
+from functools import lru_cache
+from typing import Iterable
+import re
+
+from utils import filemanager
+
+# tokens dropped from titles, more can be added in normalizer.json: {"noise": [...]}
+DEFAULT_NOISE = (
+    " (Lyrics)",
+    " (Official Video)",
+    " (Visualization)",
+    " (Music Visualization)",
+)
+CONFIG_PATH = "normalizer.json"
+
+VIDEO_FORMAT_REGEX = re.compile(r"(.*?)\s+-\s+(.+)")
+FEAT_REGEX = re.compile(r"\s*(?:\((?:ft|featuring|feat)\.?\s*(.*)\))")
+
+
+class TitleNormalizer:
+    """
+    Cleans titles and pulls authors out of them with precompiled patterns.
+    Every noise token is removed in a single pass, and results are memoized
+    by raw title, since the same titles come back from query after query
+    """
+
+    _noise: tuple[str, ...]
+    _noise_regex: re.Pattern | None
+
+    def __init__(
+        self, noise: Iterable[str] = DEFAULT_NOISE, cache_size: int = 1 << 16
+    ) -> None:
+        self._noise = tuple(dict.fromkeys(noise))
+        # longest first, so a token containing another one wins
+        ordered = sorted(self._noise, key=len, reverse=True)
+        self._noise_regex = (
+            re.compile("|".join(re.escape(token) for token in ordered))
+            if len(ordered) > 0
+            else None
+        )
+        self.clean_name = lru_cache(maxsize=cache_size)(self._clean_name)
+        self.title_authors = lru_cache(maxsize=cache_size)(self._title_authors)
+        self.split_author = lru_cache(maxsize=cache_size)(self._split_author)
+
+    @property
+    def noise(self) -> tuple[str, ...]:
+        """Returns tokens removed from titles"""
+        return self._noise
+
+    def _clean_name(self, name: str) -> str:
+        """Returns name without noise tokens and without an 'Artist - ' prefix"""
+        if self._noise_regex is not None:
+            name = self._noise_regex.sub("", name)
+        match = VIDEO_FORMAT_REGEX.search(name)
+        if match:
+            name = match.groups()[1]
+        return name
+
+    def _title_authors(self, name: str) -> tuple[str, ...]:
+        """Returns authors named in a title: featured ones and an 'Artist - ' prefix"""
+        authors: list[str] = []
+        match = FEAT_REGEX.search(name)
+        if match:
+            authors.append(match.groups()[0])
+        match = VIDEO_FORMAT_REGEX.search(name)
+        if match:
+            authors.append(match.groups()[0])
+        return tuple(authors)
+
+    def _split_author(self, author: str) -> tuple[str, ...]:
+        """Returns authors credited together in one string ('A & B', 'A / B')"""
+        authors: list[str] = []
+        if " & " in author:
+            authors.extend(author.split(" & "))
+        if " / " in author:
+            authors.extend(author.split(" / "))
+        return tuple(authors)
+
+
+def load_normalizer(path: str = CONFIG_PATH) -> TitleNormalizer:
+    """Returns a normalizer with default noise tokens plus configured ones"""
+    noise = list(DEFAULT_NOISE)
+    if filemanager.does_file_exist(path):
+        noise.extend(filemanager.read_json_file(path).get("noise", []))
+    return TitleNormalizer(noise)
@@ -0,0 +1,36 @@
+from classes import Song
+from utils import possibility, similarity
+
+# (id, name, authors, duration, album), cheap to pickle
+CompactSong = tuple[str, str, tuple[str, ...], int | None, str | None]
+# a formatted song and raw candidates it has not seen yet
+ScoreTask = tuple[CompactSong, list[CompactSong]]
+
+
+def compact(song: Song) -> CompactSong:
+    """Returns the fields scoring needs, as plain tuples"""
+    return (song.id, song.name, tuple(song.authors), song.duration, song.album)
+
+
+def expand(data: CompactSong) -> Song:
+    """Creates a song out of its compact form"""
+    song_id, name, authors, duration, album = data
+    return Song(song_id, name, authors, duration, album)
+
+
+def score_tasks(tasks: list[ScoreTask]) -> list[list[tuple[str, str]]]:
+    """
+    Runs in worker processes: formats and scores raw candidates,
+    returning (candidate id, bucket) for those with a similar name
+    """
+    scored: list[list[tuple[str, str]]] = []
+    for song, candidates in tasks:
+        key = expand(song).normalized
+        buckets: list[tuple[str, str]] = []
+        for candidate in candidates:
+            find = possibility.format_song(expand(candidate))
+            tier = similarity.compare(key, find.normalized)
+            if tier is not None:
+                buckets.append((find.id, tier))
+        scored.append(buckets)
+    return scored
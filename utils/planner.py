@@ -0,0 +1,91 @@
+import threading
+
+from classes import Song
+from utils import filemanager, logger, possibility, slugify_cached
+
+
+class QueryPlanner:
+    """
+    Orders name variants of a song by how often their kind ('original', 'base',
+    'base+feat', ...) produced an identical match before, and drops variants
+    that normalize to the same query. Stats are persisted between runs
+    """
+
+    _path: str | None
+    _stats: dict[str, list[int]]
+    _lock: threading.Lock
+    _calls: int
+    _songs: int
+    _matches: int
+
+    def __init__(self, path: str | None = "query_stats.json") -> None:
+        self._path = path
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._songs = 0
+        self._matches = 0
+
+        if path is not None and filemanager.does_file_exist(path):
+            stats = filemanager.read_json_file(path)
+            self._stats = {kind: list(counts) for (kind, counts) in stats.items()}
+
+    @property
+    def calls(self) -> int:
+        """Returns search calls made this run"""
+        return self._calls
+
+    @property
+    def matches(self) -> int:
+        """Returns songs matched this run"""
+        return self._matches
+
+    @property
+    def calls_per_match(self) -> float:
+        """Returns average search calls spent per matched song"""
+        return self._calls / self._matches if self._matches > 0 else float(self._calls)
+
+    def hit_rate(self, kind: str) -> float:
+        """Returns smoothed share of queries of this kind that found a match"""
+        attempts, hits = self._stats.get(kind, [0, 0])
+        # laplace smoothing, unseen kinds start at 0.5
+        return (hits + 1) / (attempts + 2)
+
+    def plan(self, song: Song) -> list[tuple[str, str]]:
+        """Returns (kind, name) variants to query, most promising first"""
+        unique: dict[str, tuple[str, str]] = {}
+        for kind, name in possibility.get_possible_variants(song):
+            unique.setdefault(slugify_cached(name), (kind, name))
+
+        variants = list(unique.values())
+        with self._lock:
+            variants.sort(key=lambda variant: -self.hit_rate(variant[0]))
+        return variants
+
+    def record(self, kind: str, matched: bool) -> None:
+        """Records one search call of a variant kind and whether it found a match"""
+        with self._lock:
+            counts = self._stats.setdefault(kind, [0, 0])
+            counts[0] += 1
+            counts[1] += 1 if matched else 0
+            self._calls += 1
+
+    def finish(self, matched: bool) -> None:
+        """Records that a song is done"""
+        with self._lock:
+            self._songs += 1
+            self._matches += 1 if matched else 0
+
+    def save(self) -> None:
+        """Persists stats for the next run"""
+        if self._path is None:
+            return
+        with self._lock:
+            filemanager.create_json_file(self._path, self._stats)
+
+    def log_report(self) -> None:
+        """Logs calls-per-match metric of this run"""
+        logger.log_message(
+            f"PLANNER (songs: {self._songs} | matched: {self._matches} "
+            + f"| calls: {self._calls} | calls per match: {self.calls_per_match:.2f})"
+        )
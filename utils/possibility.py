@@ -1,21 +1,36 @@
-import re
-
 from classes import Song
+from utils import slugify_cached
+from utils.normalizer import load_normalizer
+
+# default noise tokens plus any listed in normalizer.json
+NORMALIZER = load_normalizer()
 
 
 def get_possible_names(song: Song) -> list[str]:
     """Retunrs possible name combinations for a song"""
+    return [name for (_, name) in get_possible_variants(song)]
+
+
+def get_possible_variants(song: Song) -> list[tuple[str, str]]:
+    """
+    Returns (kind, name) for every possible name combination of a song.
+    kind tells how the name was built, so stats about which kinds tend to
+    find matches can be shared between songs:
+    'original', 'base' (without brackets) or 'base+<word>' (e.g. 'base+feat')
+    """
     name = song.name.replace(")(", ") (").strip()
-    names: set[str] = set([name])
-    additions: set[str] = set()
+    variants: dict[str, str] = {name: "original"}
+    additions: list[str] = []
     while "(" in name and ")" in name:
         addition = name[name.find(" (") : name.find(")") + 1]
         name = name.replace(addition, "")
-        additions.add(addition)
-    names.add(name)
+        if addition not in additions:
+            additions.append(addition)
+    variants.setdefault(name, "base")
     for add in additions:
-        names.add(name + add)
-    return list(names)
+        tag = slugify_cached(add).split("-")[0]
+        variants.setdefault(name + add, f"base+{tag}")
+    return [(kind, variant) for (variant, kind) in variants.items()]
 
 
 def format_song(song: Song) -> Song:
@@ -27,37 +42,13 @@ def format_song(song: Song) -> Song:
 
 def format_song_authors(song: Song) -> Song:
     """Ads (feat author) to songs authors"""
-    new_authors: set[str] = set()
-    feat_regex = r"\s*(?:\((?:ft|featuring|feat)\.?\s*(.*)\))"
-    match = re.search(feat_regex, song.name)
-    if match:
-        new_authors.add(match.groups()[0])
-    video_format_regex = r"(.*?)\s+-\s+(.+)"
-    match = re.search(video_format_regex, song.name)
-    if match:
-        new_authors.add(match.groups()[0])
+    new_authors: set[str] = set(NORMALIZER.title_authors(song.name))
     for author in set(song.authors):
-        if " & " in author:
-            new_authors.update(author.split(" & "))
-        if " / " in author:
-            new_authors.update(author.split(" / "))
+        new_authors.update(NORMALIZER.split_author(author))
     new_authors_list = list(new_authors)
     new_authors_list[0:0] = song.authors
-    return Song(song.id, song.name, new_authors_list, song.duration, song.album)
+    return song.with_authors(new_authors_list)
 
 
 def format_song_name(song: Song) -> Song:
-    name = song.name
-    delete = [
-        " (Lyrics)",
-        " (Official Video)",
-        " (Visualization)",
-        " (Music Visualization)",
-    ]
-    for d in delete:
-        name = name.replace(d, "")
-    video_format_regex = r"(.*?)\s+-\s+(.+)"
-    match = re.search(video_format_regex, name)
-    if match:
-        name = match.groups()[1]
-    return Song(song.id, name, song.authors, song.duration, song.album)
+    return song.with_name(NORMALIZER.clean_name(song.name))
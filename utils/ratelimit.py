@@ -0,0 +1,254 @@
+from typing import Any, Callable, TypeVar
+import random
+import threading
+import time
+
+from utils import assert_parameter
+from utils.metrics import METRICS
+
+T = TypeVar("T")
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a throttled call ran out of retries"""
+
+
+def is_throttled(exc: Exception) -> bool:
+    """Returns True if the exception looks like a 429/quota response"""
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None) or getattr(exc, "status_code", None)
+    if status == 429:
+        return True
+
+    message = str(exc).lower()
+    return (
+        "429" in message
+        or "too many requests" in message
+        or "quota" in message
+        or "rate limit" in message
+    )
+
+
+class TokenBucket:
+    """A thread safe token bucket"""
+
+    _rate: float
+    _capacity: float
+    _tokens: float
+    _updated: float
+    _lock: threading.Lock
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        assert_parameter(rate, (int, float), "rate")  # type: ignore
+        if rate <= 0:
+            raise ValueError("Rate must be greater than 0")
+
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        """Returns amount of tokens added per second"""
+        return self._rate
+
+    @rate.setter
+    def rate(self, value: float) -> None:
+        with self._lock:
+            self._refill()
+            self._rate = value
+
+    def acquire(self) -> None:
+        """Blocks until a token is available and takes it"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+
+class RetryBudget:
+    """Allows retries only while they stay a small fraction of successful calls"""
+
+    _ratio: float
+    _max_tokens: float
+    _tokens: float
+    _lock: threading.Lock
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 20) -> None:
+        self._ratio = ratio
+        self._max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        """Called after every successful call"""
+        with self._lock:
+            self._tokens = min(self._max_tokens, self._tokens + self._ratio)
+
+    def withdraw(self) -> bool:
+        """Takes one retry out of the budget, returns False if it is empty"""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RateLimiter:
+    """
+    Token bucket whose rate adapts to throttling (AIMD):
+    every success adds 'increase' req/s per second of traffic,
+    every throttled response multiplies the rate by 'decrease'.
+    Throttled calls are retried with jittered exponential backoff
+    """
+
+    _name: str
+    _bucket: TokenBucket
+    _min_rate: float
+    _max_rate: float
+    _increase: float
+    _decrease: float
+    _retries: int
+    _base_delay: float
+    _max_delay: float
+    _budget: RetryBudget
+    _last_decrease: float
+    _lock: threading.Lock
+    _throttled: int
+    _retried: int
+
+    def __init__(
+        self,
+        name: str,
+        rate: float = 5.0,
+        max_rate: float = 20.0,
+        min_rate: float = 0.5,
+        increase: float = 0.5,
+        decrease: float = 0.5,
+        retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ) -> None:
+        assert_parameter(name, str, "name")
+        if not 0 < decrease < 1:
+            raise ValueError("Decrease factor must be in range (0, 1)")
+
+        self._name = name
+        self._bucket = TokenBucket(rate, max_rate)
+        self._min_rate = min_rate
+        self._max_rate = max_rate
+        self._increase = increase
+        self._decrease = decrease
+        self._retries = retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._budget = RetryBudget()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._throttled = 0
+        self._retried = 0
+
+    @property
+    def name(self) -> str:
+        """Returns provider name"""
+        return self._name
+
+    @property
+    def rate(self) -> float:
+        """Returns current allowed requests per second"""
+        return self._bucket.rate
+
+    @property
+    def throttled(self) -> int:
+        """Returns amount of throttled responses"""
+        return self._throttled
+
+    @property
+    def retried(self) -> int:
+        """Returns amount of retries made"""
+        return self._retried
+
+    def call(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Calls func once a token is available, retrying throttled calls"""
+        attempt = 0
+        while True:
+            self._bucket.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as exc:
+                if not is_throttled(exc):
+                    raise
+                self._on_throttle()
+                if attempt >= self._retries or not self._budget.withdraw():
+                    raise RateLimitExceeded(
+                        f"{self._name}: gave up after {attempt + 1} throttled attempts"
+                    ) from exc
+                attempt += 1
+                with self._lock:
+                    self._retried += 1
+                METRICS.inc("ratelimit_retries_total", provider=self._name)
+                time.sleep(self._backoff(attempt))
+            else:
+                self._on_success()
+                return result
+
+    def _backoff(self, attempt: int) -> float:
+        """Full jitter exponential backoff"""
+        cap = min(self._max_delay, self._base_delay * 2**attempt)
+        return random.uniform(0, cap)
+
+    def _on_success(self) -> None:
+        self._budget.deposit()
+        with self._lock:
+            rate = self._bucket.rate
+            if rate < self._max_rate:
+                self._bucket.rate = min(self._max_rate, rate + self._increase / rate)
+                METRICS.set_gauge(
+                    "ratelimit_rate", self._bucket.rate, provider=self._name
+                )
+
+    def _on_throttle(self) -> None:
+        now = time.monotonic()
+        METRICS.inc("ratelimit_throttled_total", provider=self._name)
+        with self._lock:
+            self._throttled += 1
+            rate = self._bucket.rate
+            # a burst of 429s for requests sent at the old rate counts as one signal
+            if now - self._last_decrease < 1:
+                return
+            self._last_decrease = now
+            self._bucket.rate = max(self._min_rate, rate * self._decrease)
+            METRICS.set_gauge("ratelimit_rate", self._bucket.rate, provider=self._name)
+
+    def __str__(self) -> str:
+        return (
+            f"LIMITER (name: {self._name} | rate: {self.rate:.2f}/s "
+            + f"| throttled: {self.throttled} | retried: {self.retried})"
+        )
+
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str, rate: float = 5.0, max_rate: float = 20.0) -> RateLimiter:
+    """Returns the limiter shared by every client of a provider, creating it once"""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = RateLimiter(name, rate, max_rate)
+            _limiters[name] = limiter
+        return limiter
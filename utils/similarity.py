@@ -1,7 +1,10 @@
-import difflib
+from typing import Iterable
 
-from classes import Song
-from utils import slugify
+from classes import Song, NormalizedSong
+from utils.fuzzy import NameScorer
+
+# swap for NameScorer(backend="difflib") to skip rapidfuzz even if installed
+NAME_SCORER = NameScorer(0.8)
 
 
 class SimilarSongs:
@@ -41,24 +44,82 @@ class SimilarSongs:
     def song(self):
         return self._song
 
+    @property
+    def tier(self) -> str:
+        """Returns the best non-empty bucket: identical/similar/other/none"""
+        if len(self._identical) > 0:
+            return "identical"
+        if len(self._similar) > 0:
+            return "similar"
+        if len(self._others) > 0:
+            return "other"
+        return "none"
+
+
+class MatchResult:
+    """Outcome of matching a single source song"""
+
+    _source: Song
+    _found: SimilarSongs
+    _chosen: list[Song]
+
+    def __init__(self, source: Song, found: SimilarSongs, chosen: list[Song]) -> None:
+        self._source = source
+        self._found = found
+        self._chosen = chosen
+
+    @property
+    def source(self) -> Song:
+        """Returns the song as it came from the source api"""
+        return self._source
+
+    @property
+    def found(self) -> SimilarSongs:
+        """Returns every candidate bucket"""
+        return self._found
+
+    @property
+    def chosen(self) -> list[Song]:
+        """Returns selected candidates (one if sure, several if ambiguous)"""
+        return self._chosen
+
+    @property
+    def target_id(self) -> str | None:
+        """Returns the matched id if the match is unambiguous"""
+        return self._chosen[0].id if len(self._chosen) == 1 else None
+
+    @property
+    def tier(self) -> str:
+        """Returns match tier"""
+        return self._found.tier if len(self._chosen) > 0 else "none"
+
+    @property
+    def score(self) -> float | None:
+        """Returns name similarity of the best chosen candidate"""
+        if len(self._chosen) == 0:
+            return None
+        name = self._found.song.name
+        return max(NAME_SCORER.ratio(name, c.name) for c in self._chosen)
+
 
-def have_similar_names(left: Song, right: Song) -> bool:
-    """Returns true if songs have similar authors"""
-    diff = difflib.SequenceMatcher(None, left.name, right.name).ratio()
-    return diff > 0.8
+def have_similar_names(
+    left: Song | NormalizedSong, right: Song | NormalizedSong
+) -> bool:
+    """Returns true if songs have similar names"""
+    return NAME_SCORER.is_similar(left.name, right.name)
 
 
-def have_similar_authors(left: Song, right: Song) -> bool:
-    """Returns true if songs have similar authors"""
-    left_set = set(left.authors)
-    right_set = set(right.authors)
-    diff = left_set - right_set
-    if len(diff) < len(left_set):
-        return True
-    return False
+def have_similar_authors(
+    left: Song | NormalizedSong, right: Song | NormalizedSong
+) -> bool:
+    """Returns true if songs share at least one author"""
+    # frozenset() of a frozenset is a no-op, so normalized songs are not copied
+    return not frozenset(left.authors).isdisjoint(right.authors)
 
 
-def have_similar_duration(left: Song, right: Song) -> bool:
+def have_similar_duration(
+    left: Song | NormalizedSong, right: Song | NormalizedSong
+) -> bool:
     """Returns True if songs have similar duration"""
     return (
         left.duration is not None
@@ -67,43 +128,122 @@ def have_similar_duration(left: Song, right: Song) -> bool:
     )
 
 
-def find_best(song_og: Song, finds_og: list[Song]) -> SimilarSongs:
-    """Finds best match/matches out of the list of candidates"""
-    result = SimilarSongs(song_og)
-    song_slug = Song(
-        song_og.id,
-        song_og.name,
-        [slugify(a) for a in song_og.authors],
-        song_og.duration,
-        slugify(song_og.album),
+class SongMatcher:
+    """
+    Incrementally sorts candidates for a song into identical/similar/others.
+    Candidates are stored by id, so each one is scored only once
+    no matter how many queries return it
+    """
+
+    _song: Song
+    _key: NormalizedSong
+    _candidates: dict[str, Song]
+    _found: SimilarSongs
+
+    def __init__(self, song: Song) -> None:
+        self._song = song
+        self._key = song.normalized
+        self._candidates = {}
+        self._found = SimilarSongs(song)
+
+    @property
+    def song(self) -> Song:
+        """Returns the song being matched"""
+        return self._song
+
+    @property
+    def candidates(self) -> list[Song]:
+        """Returns every candidate seen so far"""
+        return list(self._candidates.values())
+
+    def has_candidate(self, song_id: str) -> bool:
+        """Returns True if a candidate with this id was already scored"""
+        return song_id in self._candidates
+
+    def add(self, finds: Iterable[Song]) -> None:
+        """Scores candidates that were not seen before"""
+        for find in finds:
+            # first candidate with a given id wins
+            if find.id in self._candidates:
+                continue
+            self._candidates[find.id] = find
+            self._score(find)
+
+    def add_scored(self, find: Song, tier: str | None) -> None:
+        """Records a candidate that was already scored elsewhere, e.g. in a worker"""
+        if find.id in self._candidates:
+            return
+        self._candidates[find.id] = find
+        if tier is not None:
+            place(self._found, find, tier)
+
+    def _score(self, find: Song) -> None:
+        tier = compare(self._key, find.normalized)
+        if tier is not None:
+            place(self._found, find, tier)
+
+    @property
+    def result(self) -> SimilarSongs:
+        """Returns current best matches"""
+        return promote_similar(self._found)
+
+
+def compare(left: Song | NormalizedSong, right: Song | NormalizedSong) -> str | None:
+    """Returns the bucket right belongs to when matching left, None if names differ"""
+    if not have_similar_names(left, right):
+        return None
+    return tier_of(
+        have_similar_authors(left, right), have_similar_duration(left, right)
     )
-    finds_slug = [
-        Song(
-            s.id,
-            s.name,
-            [slugify(a) for a in s.authors],
-            s.duration,
-            slugify(s.album),
-        )
-        for s in finds_og
-    ]
-    for find_slug in finds_slug:
-        if not have_similar_names(song_slug, find_slug):
-            continue
-        authors = have_similar_authors(song_slug, find_slug)
-        duration = have_similar_duration(song_slug, find_slug)
-        find_og = next(f for f in finds_og if f.id == find_slug.id)
-        if authors and duration:
-            result.add_identical(find_og)
-        elif authors and not duration:
-            result.add_similar(find_og)
-        else:
-            result.add_other(find_og)
+
+
+def tier_of(authors: bool, duration: bool) -> str:
+    """Returns the bucket of a candidate with a similar name"""
+    if authors and duration:
+        return "identical"
+    if authors and not duration:
+        return "similar"
+    return "other"
+
+
+def classify(found: SimilarSongs, find: Song, authors: bool, duration: bool) -> None:
+    """Puts a candidate with a similar name into the right bucket"""
+    place(found, find, tier_of(authors, duration))
+
+
+def place(found: SimilarSongs, find: Song, tier: str) -> None:
+    """Puts a candidate into the bucket named tier"""
+    if tier == "identical":
+        found.add_identical(find)
+    elif tier == "similar":
+        found.add_similar(find)
+    else:
+        found.add_other(find)
+
+
+def promote_similar(found: SimilarSongs) -> SimilarSongs:
+    """
+    Without a duration to compare, a couple of similar songs is good enough:
+    returns a copy where they also count as identical
+    """
     if (
-        song_og.duration is None
-        and len(result.identical) == 0
-        and len(result.similar) <= 2
+        found.song.duration is not None
+        or len(found.identical) > 0
+        or not 0 < len(found.similar) <= 2
     ):
-        for sim in result.similar:
-            result.add_identical(sim)
-    return result
+        return found
+
+    promoted = SimilarSongs(found.song)
+    for sim in found.similar:
+        promoted.add_similar(sim)
+        promoted.add_identical(sim)
+    for other in found.others:
+        promoted.add_other(other)
+    return promoted
+
+
+def find_best(song_og: Song, finds_og: list[Song]) -> SimilarSongs:
+    """Finds best match/matches out of the list of candidates"""
+    matcher = SongMatcher(song_og)
+    matcher.add(finds_og)
+    return matcher.result
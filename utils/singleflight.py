@@ -0,0 +1,132 @@
+from typing import Any, Callable, Hashable, TypeVar
+import threading
+
+from utils.metrics import METRICS
+
+T = TypeVar("T")
+
+
+class Flight:
+    """A call in progress, waited on by every caller that asked for the same thing"""
+
+    _done: threading.Event
+    _result: Any
+    _error: BaseException | None
+    _waiters: int
+
+    def __init__(self) -> None:
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+        self._waiters = 0
+
+    def finish(self, result: Any, error: BaseException | None) -> None:
+        """Hands the outcome over to the waiting callers"""
+        self._result = result
+        self._error = error
+        self._done.set()
+
+    def wait(self) -> Any:
+        """Blocks until the call is done, returning its result or raising its error"""
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call with some key is running,
+    callers with the same key wait for it and share its result (or error)
+    instead of making their own. Shared results must not be mutated
+    """
+
+    _flights: dict[Hashable, Flight]
+    _lock: threading.Lock
+    _calls: int
+    _saved: int
+
+    def __init__(self) -> None:
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._saved = 0
+
+    @property
+    def calls(self) -> int:
+        """Returns amount of calls actually made"""
+        return self._calls
+
+    @property
+    def saved(self) -> int:
+        """Returns amount of calls answered by a call already in flight"""
+        return self._saved
+
+    def do(
+        self,
+        key: Hashable,
+        func: Callable[..., T],
+        *args: Any,
+        labels: dict[str, str] | None = None,
+        **kwargs: Any,
+    ) -> T:
+        """Calls func, or waits for the call already running under key"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = Flight()
+                self._flights[key] = flight
+                self._calls += 1
+                leader = True
+            else:
+                self._saved += 1
+                leader = False
+
+        if not leader:
+            METRICS.inc("coalesced_calls_total", **(labels or {}))
+            return flight.wait()
+
+        result = None
+        error: BaseException | None = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.finish(result, error)
+
+    def reset(self) -> None:
+        """Zeroes call counters"""
+        with self._lock:
+            self._calls = 0
+            self._saved = 0
+
+    def __str__(self) -> str:
+        return f"SINGLE FLIGHT (calls: {self._calls} | coalesced: {self._saved})"
+
+
+def flight_key(owner: object, func: Callable, args: tuple, kwargs: dict) -> Hashable:
+    """
+    Returns a key telling identical calls apart, None if an argument
+    is not hashable (such calls are never coalesced)
+    """
+    key = (
+        id(owner),
+        getattr(func, "__qualname__", type(func).__qualname__),
+        id(getattr(func, "__self__", None)),
+        args,
+        tuple(sorted(kwargs.items())),
+    )
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+# shared by every api, keys tell apis and their clients apart
+FLIGHTS = SingleFlight()
@@ -0,0 +1,172 @@
+import threading
+
+from classes import Song
+from utils import filemanager
+from utils.export import ExportRecord
+
+
+class PlaylistDiff:
+    """What changed in a source playlist since its last snapshot"""
+
+    _added: list[Song]
+    _removed: list[ExportRecord]
+    _kept: list[ExportRecord]
+
+    def __init__(
+        self, added: list[Song], removed: list[ExportRecord], kept: list[ExportRecord]
+    ) -> None:
+        self._added = added
+        self._removed = removed
+        self._kept = kept
+
+    @property
+    def added(self) -> list[Song]:
+        """
+        Returns songs still to be matched: not in the snapshot, or in it
+        without an identical match (those are retried)
+        """
+        return self._added
+
+    @property
+    def removed(self) -> list[ExportRecord]:
+        """Returns records of songs no longer in the playlist"""
+        return self._removed
+
+    @property
+    def kept(self) -> list[ExportRecord]:
+        """Returns records of songs still in the playlist, identically matched before"""
+        return self._kept
+
+    def __str__(self) -> str:
+        return (
+            f"DIFF (added: {len(self._added)} | removed: {len(self._removed)} "
+            + f"| unchanged: {len(self._kept)})"
+        )
+
+
+def diff_playlist(snapshot: list[ExportRecord], songs: list[Song]) -> PlaylistDiff:
+    """
+    Compares current songs of a playlist with its snapshot, by song id.
+    Songs whose snapshot record has no identical target count as added again
+    """
+    previous = {r.song.id: r for r in snapshot}
+    current = {s.id for s in songs}
+    added: list[Song] = []
+    kept: list[ExportRecord] = []
+    seen: set[str] = set()
+    for song in songs:
+        if song.id in seen:
+            continue
+        seen.add(song.id)
+        record = previous.get(song.id)
+        if (
+            record is not None
+            and record.tier == "identical"
+            and record.target_id is not None
+        ):
+            kept.append(record)
+        else:
+            added.append(song)
+    removed = [r for r in snapshot if r.song.id not in current]
+    return PlaylistDiff(added, removed, kept)
+
+
+class SyncState:
+    """
+    Persisted snapshot of every synced playlist: its songs in order, each with
+    the record it was matched to, plus target ids the sync itself added
+    (only those are ever removed again) and released ones still to be removed
+    """
+
+    _path: str | None
+    _playlists: dict[str, list[ExportRecord]]
+    _added: set[str]
+    _pending: set[str]
+    _lock: threading.Lock
+
+    def __init__(self, path: str | None = "sync.json") -> None:
+        self._path = path
+        self._playlists = {}
+        self._added = set()
+        self._pending = set()
+        self._lock = threading.Lock()
+
+        if path is not None and filemanager.does_file_exist(path):
+            data = filemanager.read_json_file(path)
+            self._playlists = {
+                name: [ExportRecord.from_dict(entry) for entry in entries]
+                for (name, entries) in data.get("playlists", {}).items()
+            }
+            self._added = set(data.get("added", []))
+            self._pending = set(data.get("pending_removals", []))
+
+    def snapshot(self, name: str) -> list[ExportRecord]:
+        """Returns records of a playlist as of the last sync, empty if never synced"""
+        return self._playlists.get(name, [])
+
+    def update(self, name: str, records: list[ExportRecord]) -> None:
+        """Replaces the snapshot of a playlist"""
+        with self._lock:
+            self._playlists[name] = records
+
+    def mark_added(self, target_ids: list[str]) -> None:
+        """Remembers targets put into favorites by the sync"""
+        with self._lock:
+            self._added.update(target_ids)
+
+    def release(self, records: list[ExportRecord]) -> list[str]:
+        """
+        Moves targets of removed records that the sync added and that no song
+        of any snapshot is matched to anymore to the pending removals, returning
+        every pending removal (including ones that failed before)
+        """
+        with self._lock:
+            referenced = {
+                r.target_id
+                for entries in self._playlists.values()
+                for r in entries
+                if r.target_id is not None
+            }
+            released = {
+                r.target_id
+                for r in records
+                if r.target_id is not None
+                and r.target_id in self._added
+                and r.target_id not in referenced
+            }
+            self._added.difference_update(released)
+            self._pending.update(released)
+            # matched again since, so owned by the sync again instead
+            kept = self._pending & referenced
+            self._pending.difference_update(kept)
+            self._added.update(kept)
+            return sorted(self._pending)
+
+    def mark_removed(self, target_ids: list[str]) -> None:
+        """Forgets pending removals that went through"""
+        with self._lock:
+            self._pending.difference_update(target_ids)
+
+    def save(self) -> None:
+        """Persists every snapshot for the next run"""
+        if self._path is None:
+            return
+        with self._lock:
+            filemanager.create_json_file(
+                self._path,
+                {
+                    "playlists": {
+                        name: [r.to_dict() for r in records]
+                        for (name, records) in self._playlists.items()
+                    },
+                    "added": sorted(self._added),
+                    "pending_removals": sorted(self._pending),
+                },
+            )
+
+    def __str__(self) -> str:
+        return (
+            f"SYNC STATE (path: {self._path} | playlists: {len(self._playlists)} "
+            + f"| added by sync: {len(self._added)} "
+            + f"| pending removals: {len(self._pending)})"
+        )